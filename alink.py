@@ -1,8 +1,12 @@
 # pyright: reportMissingImports=false
-from debug import Terminated, IS_MICROPYTHON, inc_stat
+from debug import Terminated, IS_MICROPYTHON, inc_stat, register_stat
+from framer import Framer, build_header_table
 import com
 import config
+import cvs
 import debug
+import idlegc
+import locos
 import log
 import scheduler
 
@@ -10,6 +14,9 @@ import scheduler
 # Current version of this implementation
 VERSION = "v0.6"
 
+STAT_HANDLED = register_stat("Handled messages")
+STAT_UNHANDLED = register_stat("Unhandled messages")
+
 # Loco function bit mapping by bank
 #   key: Bank number
 #   values: Tuple of function ids in their bit order from lowest bit to highest bit
@@ -30,41 +37,58 @@ DEBUG_FUNCTIONS = {
     28: debug.function_exit_script
 }
 
-# CV data store
+# Constant replies, prepared up front so that they're ready to send as they are
+PING_REPLY = com.with_checksum((0x62, 0x22, 0x40))
+PING_ERRORED_REPLY = com.with_checksum((0x62, 0x22, 0xc1))
+VERSION_REPLY = com.with_checksum((0x63, 0x21, config.DEVICE_VERSION, 0x01))
+# Speed step mode reported in loco information replies, we only support 128 steps
+SPEED_STEPS_128 = 0x04
+
+CV_ACK_REPLY = com.with_checksum((0x61, 0x02)) * 2 + com.with_checksum((0x61, 0x01)) * 2
+
+# Replies with variable content are filled in place in these buffers rather than built for each
+# request, the last byte is left for the checksum
+LOCO_INFO_REPLY = bytearray((0xE4, SPEED_STEPS_128, 0, 0, 0, 0))
+FUNCTION_INFO_REPLY = bytearray((0xE3, 0x52, 0, 0, 0))
+CV_READ_REPLY = bytearray((0x63, 0x14, 0, 0, 0))
+
+# CV selected for service mode programming
 current_cv = 0
-CVS = [0] * 256
-CVS[1] = 3
-CVS[3] = 5
-CVS[4] = 5
-CVS[7] = 100
-CVS[8] = 255
-CVS[10] = 128
-CVS[29] = 6
 
 
 ###################################################################################################
-# Trie
-# We use a trie to match incoming bytes to their eventual handler
+# Dispatch
+# Complete frames are matched to their handler using their first two bytes, or just the header for
+# single byte frames
 ###################################################################################################
 
-def add_to_trie(node, handler):
-    sequence = handler[0]
-    handler = handler[1]
-    for b in sequence[:-1]:
-        n = node.get(b)
-        if not n:
-            n = {}
-            node[b] = n
-        node = n
+def handler_key(sequence):
+    if len(sequence) == 1:
+        return sequence[0]
+    return (sequence[0] << 8) | sequence[1]
 
-    node[sequence[-1]] = handler
+def build_handler_table():
+    table = {}
+    for sequence, handler in ROOT_HANDLERS:
+        table[handler_key(sequence)] = handler
 
-def build_handler_trie():
-    root = {}
-    for handler in ROOT_HANDLERS:
-        add_to_trie(root, handler)
+    return table
 
-    return root
+def for_each_function(functions, changed, state, action):
+    # Calls action with the id of each function in a bank whose bit is set in changed, and whether
+    # its bit is set in state
+    bit = 1
+    for f in functions:
+        if bit > changed:
+            break
+        if changed & bit:
+            action(f, state & bit != 0)
+        bit <<= 1
+
+# Compiled variant, see native_micropy
+py_for_each_function = for_each_function
+if IS_MICROPYTHON and config.NATIVE_CODE:
+    from native_micropy import for_each_function
 
 # Micropython needs to be told not to interpret byte value 3 on stdin as Ctrl+C
 def binary_mode(enabled):
@@ -77,8 +101,8 @@ def binary_mode(enabled):
 # Handlers
 ###################################################################################################
 
-def unrecognisedHandler(buffer):
-    sequence = com.to_hex(buffer)
+def unrecognisedHandler(frame):
+    sequence = com.to_hex(frame)
     log.warn(sequence)
 
 
@@ -86,189 +110,244 @@ def pingHandler(_):
     if (config.LOG_PING):
         log.info("Ping request")
     if debug.is_errored:
-        com.write_with_checksum((0x62, 0x22, 0xc1))
+        com.write(PING_ERRORED_REPLY)
     else:
-        com.write_with_checksum((0x62, 0x22, 0x40))
+        com.write(PING_REPLY)
 
 
 def versionHandler(_):
     log.info("Version request")
-    com.write_with_checksum((0x63, 0x21, config.DEVICE_VERSION, 0x01))
+    com.write(VERSION_REPLY)
 
 
 def clearErrorHandler(_):
     debug.clear_error()
-    com.write_with_checksum((0x62, 0x22, 0x40))
-
+    com.write(PING_REPLY)
 
-def locoSpeedHandler(buffer):
-    loco = com.read_into_buffer(buffer, 2)
-    speed = com.read_into_buffer(buffer, 1)[0]
-    checksum = com.read_byte()
-    if not com.is_valid_message(buffer, checksum):
-        return
 
-    loco = com.decode_loco_id(loco)
+def locoSpeedHandler(frame):
+    loco = com.decode_loco_id(frame[2:4])
+    speed = frame[4]
     forward = speed & 0x80 == 0x80
     speed = speed & 0x7f
 
+    locos.set_speed(loco, frame[4])
+
     log.info("Loco speed request")
-    log.info(f" Loco: {loco}")
-    log.info(f" Speed: {speed}")
-    log.info(f" Forward: {forward}")
+    if __debug__:
+        log.debug(" Loco: %d", loco)
+        log.debug(" Speed: %d", speed)
+        log.debug(" Forward: %s", forward)
 
     if loco == config.DEBUG_LOCO:
         debug.debug_value = speed
         if not forward:
             debug.debug_value += 128
-        log.warn(f"Debug value = {debug.debug_value}")
+        log.warn("Debug value = %d", debug.debug_value)
 
 
-def debugFunctionHandler(bank, state):
-    bit = 1
+def runDebugFunction(f, active):
+    action = DEBUG_FUNCTIONS.get(f, lambda _: None)
+    action(active)
 
-    for f in FUNCTIONS[bank]:
-        active = state & bit != 0
-        action = DEBUG_FUNCTIONS.get(f, lambda _: None)
-        action(active)
-        bit <<= 1
 
+def debugFunctionHandler(bank, changed, state):
+    # Only functions that have changed are run, so a throttle repeating a bank doesn't trigger them
+    # again
+    for_each_function(FUNCTIONS[bank], changed, state, runDebugFunction)
 
-def locoFunctionHandler(buffer):
-    bank = buffer[-1]
-    loco = com.read_into_buffer(buffer, 2)
-    state = com.read_into_buffer(buffer, 1)[0]
-    checksum = com.read_byte()
-    if not com.is_valid_message(buffer, checksum):
-        return
 
-    loco = com.decode_loco_id(loco)
+def locoFunctionHandler(frame):
+    bank = frame[1]
+    loco = com.decode_loco_id(frame[2:4])
+    state = frame[4]
+
+    changed = locos.set_functions(loco, bank, state)
+    if not changed:
+        return
 
     if loco == config.DEBUG_LOCO:
-        debugFunctionHandler(bank, state)
+        debugFunctionHandler(bank, changed, state)
         return
 
     log.info("Loco func request")
-    log.info(f" Loco: {loco}")
+    if __debug__ and log.enabled(log.DEBUG):
+        log.debug(" Loco: %d", loco)
 
-    buffer = []
-    bit = 1
+        buffer = []
 
-    for f in FUNCTIONS[bank]:
-        f = f"F{f}"
-        f += "+" if state & bit != 0 else "-"
-        buffer.append(f)
-        if len(buffer) == 4:
-            log.info(" " + " ".join(buffer))
-            buffer = []
+        def logFunction(f, active):
+            buffer.append(f"F{f}" + ("+" if active else "-"))
+            if len(buffer) == 4:
+                log.debug(" " + " ".join(buffer))
+                buffer.clear()
+
+        for_each_function(FUNCTIONS[bank], changed, state, logFunction)
+        if buffer:
+            log.debug(" " + " ".join(buffer))
+
+
+def locoInfoHandler(frame):
+    loco = com.decode_loco_id(frame[2:4])
+    log.info("Loco info request %d", loco)
+
+    reply = LOCO_INFO_REPLY
+    reply[2] = locos.get(loco, locos.SPEED)
+    reply[3] = locos.get(loco, locos.FUNCTIONS_F0_F4)
+    reply[4] = locos.get(loco, locos.FUNCTIONS_F5_F12)
+    com.write_reply(reply)
 
-        bit <<= 1
 
-    if buffer:
-        log.info(" " + " ".join(buffer))
+def locoFunctionInfoHandler(frame):
+    loco = com.decode_loco_id(frame[2:4])
+    log.info("Loco func info request %d", loco)
 
+    reply = FUNCTION_INFO_REPLY
+    reply[2] = locos.get(loco, locos.FUNCTIONS_F13_F20)
+    reply[3] = locos.get(loco, locos.FUNCTIONS_F21_F28)
+    com.write_reply(reply)
 
-def cvSelectHandler(buffer):
+
+def cvSelectHandler(frame):
     global current_cv
-    cv = com.read_into_buffer(buffer, 1)[0]
-    checksum = com.read_byte()
-    if not com.is_valid_message(buffer, checksum):
-        return
+    cv = frame[2]
 
-    log.info(f"Selected CV {cv}")
+    log.info("Selected CV %d", cv)
     current_cv = cv
 
-    com.write_with_checksum((0x61, 0x02))
-    com.write_with_checksum((0x61, 0x02))
-    com.write_with_checksum((0x61, 0x01))
-    com.write_with_checksum((0x61, 0x01))
+    com.write(CV_ACK_REPLY)
 
 
 def cvReadHandler(_):
-    log.info(f"Reading CV {current_cv}")
-    log.info(f" Value: {CVS[current_cv]}")
-    com.write_with_checksum((0x63, 0x14, current_cv, CVS[current_cv]))
+    value = cvs.read(cvs.SERVICE_TRACK, current_cv)
+    log.info("Reading CV %d", current_cv)
+    if __debug__:
+        log.debug(" Value: %d", value)
+    reply = CV_READ_REPLY
+    reply[2] = current_cv
+    reply[3] = value
+    com.write_reply(reply)
 
 
-def cvWriteHandler(buffer):
+def cvWriteHandler(frame):
     global current_cv
-    cv = com.read_into_buffer(buffer, 1)[0]
-    value = com.read_into_buffer(buffer, 1)[0]
-    checksum = com.read_byte()
-    if not com.is_valid_message(buffer, checksum):
-        return
+    cv = frame[2]
+    value = frame[3]
 
-    log.info(f"Writing CV {cv}")
-    log.info(f" Value: {value}")
+    log.info("Writing CV %d", cv)
+    if __debug__:
+        log.debug(" Value: %d", value)
 
     current_cv = cv
-    CVS[cv] = value
+    cvs.write(cvs.SERVICE_TRACK, cv, value)
+
+    com.write(CV_ACK_REPLY)
+
 
-    com.write_with_checksum((0x61, 0x02))
-    com.write_with_checksum((0x61, 0x02))
-    com.write_with_checksum((0x61, 0x01))
-    com.write_with_checksum((0x61, 0x01))
+def pomWriteHandler(frame):
+    # Operations mode (programming on main) byte write. There's no reply for these.
+    loco = com.decode_loco_id(frame[2:4])
+    mode = frame[4]
+    if mode & 0xFC != 0xEC:
+        log.warn("Unsupported POM mode 0x%02x", mode)
+        return
+
+    cv = (((mode & 0x03) << 8) | frame[5]) + 1
+    value = frame[6]
+    log.info("POM writing CV %d", cv)
+    if __debug__:
+        log.debug(" Loco: %d", loco)
+        log.debug(" Value: %d", value)
+
+    # CVs are stored as they're numbered in service mode, where CV 256 is sent as 0
+    if cv > cvs.PAGE_SIZE:
+        log.warn("CV %d out of range", cv)
+        return
+    cvs.write(loco, cv & 0xFF, value)
 
 
 def debugHandler(_):
     binary_mode(False)
     try:
-        debug.open_debug_menu()
+        # Keys are read through com so that anything already buffered isn't skipped
+        import debugmenu
+        debugmenu.open_debug_menu(lambda: chr(com.read_byte()))
     finally:
         binary_mode(True)
 
 
 # Handlers are registered by associating a trigger byte sequence with a function to invoke.
-# This list gets reparsed into a trie for more optimal lookup at run time.
+# The header of each sequence determines the frame length, and the whole frame must have a valid
+# checksum before its handler is invoked.
 ROOT_HANDLERS = [
-    ((0x21, 0x10, 0x31), cvReadHandler),
-    ((0x21, 0x21, 0x00), versionHandler),
-    ((0x21, 0x24, 0x05), pingHandler),
-    ((0x21, 0x81, 0xa0), clearErrorHandler),
+    ((0x21, 0x10), cvReadHandler),
+    ((0x21, 0x21), versionHandler),
+    ((0x21, 0x24), pingHandler),
+    ((0x21, 0x81), clearErrorHandler),
     ((0x22, 0x15), cvSelectHandler),
     ((0x23, 0x16), cvWriteHandler),
+    ((0xE3, 0x00), locoInfoHandler),
+    ((0xE3, 0x09), locoFunctionInfoHandler),
+    ((0xE6, 0x30), pomWriteHandler),
     ((0xE4, 0x13), locoSpeedHandler),
     ((0xE4, 0x20), locoFunctionHandler),
     ((0xE4, 0x21), locoFunctionHandler),
     ((0xE4, 0x22), locoFunctionHandler),
     ((0xE4, 0x23), locoFunctionHandler),
     ((0xE4, 0x28), locoFunctionHandler),
-    ((ord('~'),), debugHandler)
+    ((com.DEBUG_TRIGGER,), debugHandler)
 ]
 
-ROOT_HANDLERS = build_handler_trie()
+HANDLERS = build_handler_table()
+
+if config.HANDLER_PROFILING:
+    import profiler
+    unrecognisedHandler = profiler.timed(unrecognisedHandler)
+    HANDLERS = profiler.timed_table(HANDLERS)
+FRAMER = Framer(build_header_table([sequence for sequence, _ in ROOT_HANDLERS]))
 
 ###################################################################################################
 # Main script
 ###################################################################################################
 
+def dispatch_frame(frame):
+    handler = HANDLERS.get(handler_key(frame), unrecognisedHandler)
+    try:
+        result = handler(frame)
+    finally:
+        # Everything the handler wrote goes out in a single write
+        com.flush()
+
+    if handler == unrecognisedHandler:
+        inc_stat(STAT_UNHANDLED)
+    else:
+        inc_stat(STAT_HANDLED)
+    return result
+
+def do_events():
+    try:
+        return scheduler.do_events()
+    finally:
+        com.flush()
+
+def dispatch_message(event_cb=None, period=None):
+    return dispatch_frame(com.read_frame(FRAMER, event_cb, period))
+
+
 def main():
-    log.info(f"alink {VERSION}")
+    log.info("alink %s", VERSION)
     log.info("Starting...")
     log.info("~ for debug mode")
 
     # We expect binary data over stdin, so disable Micropython's Ctrl+C interrupt
     binary_mode(True)
+    if config.LOW_GC:
+        idlegc.start()
 
     try:
         while True:
             try:
-                # Start of a new byte sequence
-                node = ROOT_HANDLERS
-                buffer = []
-
-                # Keep reading bytes until we reach the end of a recognised sequence
-                while True:
-                    c = com.read_byte(scheduler.do_events, config.SCHEDULER_PERIOD)
-                    buffer.append(c)
-                    node = node.get(c, unrecognisedHandler)
-                    if callable(node):
-                        node(buffer)
-                        if node == unrecognisedHandler:
-                            inc_stat("Unhandled messages")
-                        else:
-                            inc_stat("Handled messages")
-                        break
+                dispatch_message(do_events, config.SCHEDULER_PERIOD)
 
             except Terminated:
                 break
@@ -278,6 +357,9 @@ def main():
 
     finally:
         binary_mode(False)
+        if config.LOW_GC:
+            idlegc.stop()
+        cvs.flush_all()
 
     log.info("aLink shutdown")
 
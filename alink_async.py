@@ -0,0 +1,192 @@
+# pyright: reportMissingImports=false
+# Optional asyncio engine for the command station.
+#
+# Rather than blocking on stdin and polling the scheduler between bytes, stdin is read through an
+# asyncio stream reader and scheduled events become native timer tasks. Slow work such as the error
+# state countdown can then run alongside protocol handling instead of holding it up.
+import sys
+from debug import Terminated, IS_MICROPYTHON
+import alink
+import com
+import config
+import cvs
+import debug
+import idlegc
+import log
+import scheduler
+
+try:
+    import asyncio
+except ImportError:
+    import uasyncio as asyncio
+
+
+_protocol_task = None
+
+# Jobs waiting on a timer task, handed back to the scheduler when the event loop stops
+_timer_jobs = set()
+
+class _FileReader:
+    # Regular files can't be attached to the event loop, but reading them never blocks
+    async def read(self, size):
+        return sys.stdin.buffer.raw.read(size)
+
+async def _open_stdin():
+    if IS_MICROPYTHON:
+        return asyncio.StreamReader(sys.stdin.buffer)
+
+    loop = asyncio.get_event_loop()
+    reader = asyncio.StreamReader()
+    try:
+        await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), sys.stdin.buffer)
+    except ValueError:
+        return _FileReader()
+    return reader
+
+async def _read(reader):
+    # Micropython's stdin blocks until the requested number of bytes has arrived, so only ask it
+    # for what we know is there
+    size = 1 if IS_MICROPYTHON else com.RX_BUFFER_SIZE - com.available()
+    data = await reader.read(size)
+    if not data:
+        raise Terminated()
+    com.feed(data)
+
+
+###################################################################################################
+# Timers
+###################################################################################################
+
+async def _timer(job):
+    while True:
+        delay = job.at - scheduler.now()
+        if delay > 0:
+            await asyncio.sleep(delay / 1000)
+
+        if job.cancelled:
+            break
+
+        if job.period:
+            job.rearm(scheduler.now())
+
+        try:
+            job.cb(*job.args)
+        except Terminated:
+            _protocol_task.cancel()
+        except Exception as ex:
+            debug.log_exception(ex)
+        finally:
+            com.flush()
+
+        if not job.period:
+            break
+
+    # Left in place if the task is cancelled by the event loop stopping
+    _timer_jobs.discard(job)
+
+def _native_timer(job):
+    _timer_jobs.add(job)
+    asyncio.create_task(_timer(job))
+
+
+###################################################################################################
+# Protocol handling
+###################################################################################################
+
+async def _read_key(reader):
+    if com.available() == 0:
+        await _read(reader)
+    return chr(com.read_byte())
+
+async def _debug_menu(reader):
+    import debugmenu
+    while True:
+        debugmenu.print_debug_menu()
+
+        while True:
+            c = await _read_key(reader)
+            action = debugmenu.DEBUG_ACTION_MAP.get(c)
+            if action is None:
+                continue
+
+            if action(print):
+                return
+
+            break
+
+async def _dispatch(reader):
+    # Wait for a whole frame so that handlers never block on the stream
+    frame = com.next_frame(alink.FRAMER)
+    while frame is None:
+        await _read(reader)
+        frame = com.next_frame(alink.FRAMER)
+
+    if frame[0] == com.DEBUG_TRIGGER:
+        alink.binary_mode(False)
+        try:
+            await _debug_menu(reader)
+        finally:
+            alink.binary_mode(True)
+        return
+
+    # Handlers may optionally be coroutines
+    result = alink.dispatch_frame(frame)
+    if result is not None:
+        await result
+        # dispatch_frame flushed before the handler got this far
+        com.flush()
+
+async def _protocol_main():
+    reader = await _open_stdin()
+    while True:
+        try:
+            await _dispatch(reader)
+        except Terminated:
+            break
+        except Exception as ex:
+            debug.log_exception(ex)
+
+        # Give timers a chance to run between messages
+        await asyncio.sleep(0)
+
+async def _main():
+    global _protocol_task
+    scheduler.set_native_timer(_native_timer)
+    _protocol_task = asyncio.create_task(_protocol_main())
+    try:
+        await _protocol_task
+    except asyncio.CancelledError:
+        pass
+    finally:
+        # Anything scheduled from here on, such as LCD frames for the final log lines, needs the
+        # event queue as there's no loop left to create tasks on
+        scheduler.clear_native_timer(_timer_jobs)
+        _timer_jobs.clear()
+
+
+###################################################################################################
+# Main script
+###################################################################################################
+
+def main():
+    log.info("alink %s (asyncio)", alink.VERSION)
+    log.info("Starting...")
+    log.info("~ for debug mode")
+
+    # We expect binary data over stdin, so disable Micropython's Ctrl+C interrupt
+    alink.binary_mode(True)
+    if config.LOW_GC:
+        idlegc.start()
+
+    try:
+        asyncio.run(_main())
+    finally:
+        alink.binary_mode(False)
+        if config.LOW_GC:
+            idlegc.stop()
+        cvs.flush_all()
+
+    log.info("aLink shutdown")
+
+if __name__ == "__main__":
+    main()
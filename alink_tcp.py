@@ -0,0 +1,213 @@
+# TCP front end for the command station, desktop only.
+#
+# Listens on localhost and serves any number of clients from a single thread with selectors. Each
+# connection has its own framer, so partial messages from one client never mix with another's, and
+# replies are sent back to the connection the request came from. Anything sent from scheduled
+# events, such as the error state reply, goes to every client.
+#
+# Usage: python alink_tcp.py [port]
+import selectors
+import socket
+import sys
+import time
+from debug import Terminated, inc_stat, register_stat
+from framer import Framer
+import alink
+import com
+import config
+import cvs
+import debug
+import idlegc
+import log
+
+RECEIVE_SIZE = 4096
+
+# Most output held for a client that isn't reading it, beyond which the client is disconnected
+MAX_PENDING = 4096
+
+STAT_OVERFLOWS = register_stat("TCP clients disconnected for not reading")
+
+_selector = None
+_connections = {}
+_receive = bytearray(RECEIVE_SIZE)
+_receive_view = memoryview(_receive)
+
+
+class Connection:
+    def __init__(self, sock, address):
+        self.sock = sock
+        self.address = address
+        self.framer = Framer(alink.FRAMER.header_table)
+        self._pending = bytearray()
+        self.closed = False
+
+    def write(self, data):
+        # Replies are sent straight away where possible, with the rest kept until the socket can
+        # take it
+        if self.closed:
+            return
+
+        if not self._pending:
+            try:
+                sent = self.sock.send(data)
+            except (BlockingIOError, InterruptedError):
+                sent = 0
+            except OSError:
+                return
+            if sent == len(data):
+                return
+            data = data[sent:]
+
+        if len(self._pending) + len(data) > MAX_PENDING:
+            inc_stat(STAT_OVERFLOWS)
+            log.warn("Client %s:%d isn't reading its replies", self.address[0], self.address[1])
+            self.close()
+            return
+
+        if not self._pending:
+            _selector.modify(self.sock, selectors.EVENT_READ | selectors.EVENT_WRITE, self)
+        self._pending += data
+
+    def send_pending(self):
+        try:
+            sent = self.sock.send(self._pending)
+        except (BlockingIOError, InterruptedError):
+            return
+        del self._pending[:sent]
+        if not self._pending:
+            _selector.modify(self.sock, selectors.EVENT_READ, self)
+
+    def receive(self):
+        count = self.sock.recv_into(_receive_view)
+        if not count:
+            return False
+
+        com.set_writer(self.write)
+        data = _receive_view[:count]
+        i = 0
+        while True:
+            i += self.framer.feed(data[i:])
+            if self.framer.ready:
+                dispatch(self.framer.frame)
+            elif i >= count:
+                break
+
+        com.flush()
+        return True
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        _selector.unregister(self.sock)
+        self.sock.close()
+        del _connections[self.sock]
+        log.info("Client %s:%d disconnected", self.address[0], self.address[1])
+
+
+def dispatch(frame):
+    if frame[0] == com.DEBUG_TRIGGER:
+        log.warn("Debug menu is only available over stdin")
+        return
+
+    try:
+        alink.dispatch_frame(frame)
+    except Terminated:
+        raise
+    except Exception as ex:
+        debug.log_exception(ex)
+
+def broadcast(data):
+    for connection in list(_connections.values()):
+        connection.write(data)
+
+def _accept(server):
+    sock, address = server.accept()
+    sock.setblocking(False)
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    connection = Connection(sock, address)
+    _connections[sock] = connection
+    _selector.register(sock, selectors.EVENT_READ, connection)
+    log.info("Client %s:%d connected", address[0], address[1])
+
+def _do_events():
+    # Scheduled events aren't replies to anyone in particular
+    com.set_writer(broadcast)
+    try:
+        return alink.do_events()
+    except Terminated:
+        raise
+    except Exception as ex:
+        debug.log_exception(ex)
+    finally:
+        com.flush()
+
+def serve(port):
+    global _selector
+    _selector = selectors.DefaultSelector()
+    server = socket.create_server((config.TCP_HOST, port))
+    server.setblocking(False)
+    _selector.register(server, selectors.EVENT_READ, None)
+    log.info("Listening on %s:%d", config.TCP_HOST, server.getsockname()[1])
+
+    # The scheduler ticks once a period, keeping its phase, or sooner if a job is due
+    period = config.SCHEDULER_PERIOD / 1000
+    next_tick = time.monotonic()
+    due_time = None
+    try:
+        while True:
+            now = time.monotonic()
+            if now >= next_tick or (due_time is not None and now >= due_time):
+                due = _do_events()
+                due_time = None if due is None else now + due / 1000
+                if now >= next_tick:
+                    next_tick += period
+                    if next_tick <= now:
+                        next_tick = now + period
+
+            wake_time = next_tick if due_time is None else min(next_tick, due_time)
+            for key, events in _selector.select(max(wake_time - now, 0)):
+                if key.data is None:
+                    _accept(server)
+                    continue
+
+                connection = key.data
+                try:
+                    if events & selectors.EVENT_WRITE and not connection.closed:
+                        connection.send_pending()
+                    if events & selectors.EVENT_READ and not connection.closed and not connection.receive():
+                        connection.close()
+                except ConnectionError:
+                    connection.close()
+
+    finally:
+        for connection in list(_connections.values()):
+            connection.close()
+        _selector.unregister(server)
+        server.close()
+
+
+###################################################################################################
+# Main script
+###################################################################################################
+
+def main(port=None):
+    log.info("alink %s (tcp)", alink.VERSION)
+    log.info("Starting...")
+
+    if config.LOW_GC:
+        idlegc.start()
+
+    try:
+        serve(config.TCP_PORT if port is None else port)
+    except Terminated:
+        pass
+    finally:
+        if config.LOW_GC:
+            idlegc.stop()
+        cvs.flush_all()
+
+    log.info("aLink shutdown")
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else None)
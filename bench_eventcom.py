@@ -0,0 +1,94 @@
+# Desktop throughput benchmark for the stdin event loop.
+#
+# Pipes a block of bytes into a child process and measures how quickly it can be consumed while
+# the scheduler tick is running. The "legacy" mode reproduces the original behaviour of creating a
+# new event thread for every byte read, "bytewise" uses the persistent selector loop but only reads
+# a single byte at a time and "ring" drains everything available in each call as com does.
+#
+# Usage: python bench_eventcom.py [byte count]
+import subprocess
+import sys
+import time
+
+DEFAULT_BYTE_COUNT = 20000
+PERIOD_MS = 1000
+MODES = ("legacy", "bytewise", "ring")
+
+
+def _legacy_read_byte(event_cb, period_ms):
+    from threading import Thread, Event
+
+    def event_thread_main(period, exit_event):
+        next_wake_time = time.time() + period
+        while not exit_event.wait(timeout=next_wake_time-time.time()):
+            event_cb()
+            next_wake_time += period
+
+    exit_event = Event()
+    thread = Thread(target=event_thread_main, args=(period_ms/1000, exit_event), daemon=True)
+    thread.start()
+
+    data = sys.stdin.buffer.read(1)
+
+    exit_event.set()
+    thread.join()
+
+    return len(data)
+
+def _child(mode):
+    import eventcom_desktop
+    from debug import Terminated
+
+    ticks = 0
+    def event_cb():
+        nonlocal ticks
+        ticks += 1
+
+    total = 0
+    buffer = memoryview(bytearray(256))
+    if mode == "bytewise":
+        buffer = buffer[:1]
+
+    start = time.perf_counter()
+    try:
+        while True:
+            if mode == "legacy":
+                count = _legacy_read_byte(event_cb, PERIOD_MS)
+                if not count:
+                    break
+            else:
+                count = eventcom_desktop.read_into(buffer, event_cb, PERIOD_MS)
+            total += count
+    except Terminated:
+        pass
+    elapsed = time.perf_counter() - start
+
+    print(f"{total} {elapsed}")
+
+def _run(mode, payload):
+    result = subprocess.run(
+        [sys.executable, __file__, "--child", mode],
+        input=payload,
+        stdout=subprocess.PIPE,
+        check=True
+    )
+    total, elapsed = result.stdout.decode().split()[-2:]
+    return int(total), float(elapsed)
+
+def main():
+    byte_count = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_BYTE_COUNT
+    payload = bytes([0x21, 0x24, 0x05]) * (byte_count // 3)
+
+    print(f"Reading {len(payload)} bytes with a {PERIOD_MS}ms scheduler period")
+    baseline = None
+    for mode in MODES:
+        total, elapsed = _run(mode, payload)
+        rate = total / elapsed
+        baseline = baseline or rate
+        print(f"  {mode:10s} {total:8d} bytes {elapsed:8.3f}s {rate:12.0f} bytes/s  x{rate / baseline:.1f}")
+
+if __name__ == "__main__":
+    if len(sys.argv) == 3 and sys.argv[1] == "--child":
+        _child(sys.argv[2])
+    else:
+        main()
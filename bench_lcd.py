@@ -0,0 +1,190 @@
+# Host side LCD logging benchmark.
+#
+# Installs fake machine and framebuf modules that count the bytes sent over SPI, then logs a batch
+# of lines through the original full screen renderer ("legacy") and the incremental lcdlog
+# renderer and reports how much each one transmits. The "capped" modes log bursts of lines between
+# scheduler ticks with the frame rate cap enabled.
+#
+# Usage: python bench_lcd.py [line count]
+import sys
+import time
+import types
+from stats import STATS
+
+DEFAULT_LINE_COUNT = 100
+BURST_LENGTH = 4
+
+
+###################################################################################################
+# Fakes
+###################################################################################################
+
+class FakePin:
+    OUT = 1
+
+    def __init__(self, *args, **kwargs):
+        self._value = 0
+
+    def __call__(self, value=None):
+        return self.value(value)
+
+    def value(self, value=None):
+        if value is not None:
+            self._value = value
+        return self._value
+
+class FakeSPI:
+    bytes_written = 0
+    writes = 0
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def write(self, data):
+        FakeSPI.bytes_written += len(data)
+        FakeSPI.writes += 1
+
+class FakePWM:
+    def __init__(self, pin):
+        pass
+
+    def freq(self, value):
+        pass
+
+    def duty_u16(self, value):
+        pass
+
+class FakeFrameBuffer:
+    def __init__(self, buffer, width, height, format):
+        pass
+
+    def fill(self, colour):
+        pass
+
+    def fill_rect(self, x, y, w, h, colour):
+        pass
+
+    def text(self, text, x, y, colour):
+        pass
+
+    def scroll(self, xstep, ystep):
+        pass
+
+def _install_fakes():
+    machine = types.ModuleType("machine")
+    machine.Pin = FakePin
+    machine.SPI = FakeSPI
+    machine.PWM = FakePWM
+    sys.modules["machine"] = machine
+
+    framebuf = types.ModuleType("framebuf")
+    framebuf.FrameBuffer = FakeFrameBuffer
+    framebuf.RGB565 = 1
+    sys.modules["framebuf"] = framebuf
+
+
+###################################################################################################
+# Original renderer
+###################################################################################################
+
+class LegacyLcdLog:
+    def __init__(self, device):
+        self.device = device
+        self.screen = device.Screen()
+        self.buffer = []
+
+    def info(self, text):
+        device = self.device
+        while True:
+            overflow = text[device.WIDTH:]
+            text = text[:device.WIDTH]
+
+            if (len(self.buffer) == device.HEIGHT):
+                self.buffer = self.buffer[1:]
+
+            self.buffer.append((0, text))
+
+            if not overflow:
+                break
+            text = overflow
+
+        y = device.LINE_OFFSET_Y
+        self.screen.fill(0)
+        for line in self.buffer:
+            self.screen.text(line[1], 0, y, line[0])
+            y += device.LINE_HEIGHT
+
+        self.screen.display()
+
+
+###################################################################################################
+# Benchmark
+###################################################################################################
+
+def _bench(name, info, lines):
+    FakeSPI.bytes_written = 0
+    FakeSPI.writes = 0
+
+    start = time.perf_counter()
+    for line in lines:
+        info(line)
+    elapsed = time.perf_counter() - start
+
+    per_line = FakeSPI.bytes_written / len(lines)
+    print(f"  {name:12s} {FakeSPI.bytes_written:10d} bytes  {per_line:8.0f} bytes/line  {FakeSPI.writes:6d} SPI writes  {elapsed:8.4f}s")
+
+def _burst_info(lines):
+    # Log the lines in bursts, with a simulated 100ms between each burst
+    import lcdlog
+    import scheduler
+
+    clock = [scheduler.now()]
+    real_now = scheduler.now
+    scheduler.now = lambda: clock[0]
+    pending = []
+
+    def info(line):
+        pending.append(line)
+        if len(pending) == BURST_LENGTH:
+            for text in pending:
+                lcdlog.info(text)
+            pending.clear()
+            clock[0] += 100
+            scheduler.do_events()
+
+    return info, lambda: setattr(scheduler, "now", real_now)
+
+def _open(lcdlog, device):
+    # The screen is normally opened after the first reply, but its initial clear shouldn't be counted
+    lcdlog.init(device)
+    lcdlog._open()
+
+def main():
+    line_count = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_LINE_COUNT
+    _install_fakes()
+
+    import config
+    import lcd_rp2040lcd096
+    import lcdlog
+
+    lines = [f"Line {i}" for i in range(line_count)]
+
+    print(f"Logging {line_count} lines")
+    config.LCD_MAX_FPS = 0
+    _bench("legacy", LegacyLcdLog(lcd_rp2040lcd096).info, lines)
+    for wrap in (False, True):
+        config.LCD_LOG_WRAP = wrap
+        _open(lcdlog, lcd_rp2040lcd096)
+        _bench("wrap" if wrap else "scroll", lcdlog.info, lines)
+
+    config.LCD_MAX_FPS = 10
+    for wrap in (False, True):
+        config.LCD_LOG_WRAP = wrap
+        _open(lcdlog, lcd_rp2040lcd096)
+        info, restore = _burst_info(lines)
+        _bench("capped wrap" if wrap else "capped", info, lines)
+        restore()
+        print(f"    {STATS[lcdlog.STAT_FRAMES]} frames rendered, {STATS[lcdlog.STAT_COALESCED]} lines coalesced")
+
+if __name__ == "__main__":
+    main()
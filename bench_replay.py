@@ -0,0 +1,345 @@
+# Desktop replay benchmark for the protocol engine.
+#
+# Runs alink in a child process on CPython and feeds it XpressNet byte streams through a pipe. The
+# streams are either generated (speed, function, CV select/read/write, loco info, POM, ping and
+# noise) or recorded byte streams given with --replay, which are split into messages with the same
+# framer that alink uses.
+#
+# Latency is measured closed loop: each message is sent followed by a ping and timed until the ping
+# reply comes back, as most requests don't have a reply of their own. The ping row shows the cost
+# of the fence itself. Throughput is measured by sending all the messages of each type in a single
+# stream and timing until the ping that follows them is answered.
+#
+# The bytes sent are also run through a local copy of the framer so that the number of ping replies
+# to wait for is always known, even when noise swallows a ping or contains one.
+#
+# Usage: python bench_replay.py [--count N] [--replay FILE ...] [--async] [-O]
+#                               [--output FILE] [--compare FILE]
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import config
+# Nothing from the benchmark's copy of the modules should be written to stdout
+config.STDOUT_LOGGER = False
+config.HANDLER_PROFILING = False
+
+import alink
+import com
+from framer import Framer, frame_length
+
+DEFAULT_COUNT = 1000
+DEFAULT_OUTPUT = "bench_replay.json"
+NOISE_LENGTH = 16
+SEED = 1234
+
+PING = com.with_checksum((0x21, 0x24))
+FENCE_HANDLERS = (alink.pingHandler, alink.clearErrorHandler)
+
+# Message types reported for each handler when splitting recorded streams
+HANDLER_TYPES = {
+    "locoSpeedHandler": "speed",
+    "locoFunctionHandler": "function",
+    "cvSelectHandler": "cv_select",
+    "cvReadHandler": "cv_read",
+    "cvWriteHandler": "cv_write",
+    "locoInfoHandler": "loco_info",
+    "locoFunctionInfoHandler": "function_info",
+    "pomWriteHandler": "pom",
+    "pingHandler": "ping",
+    "versionHandler": "version",
+    "clearErrorHandler": "clear_error"
+}
+
+CHILD_SCRIPT = """
+import config
+config.STDOUT_LOGGER = False
+config.CV_STORE_PATH = {path!r}
+import {engine} as engine
+engine.main()
+"""
+
+
+###################################################################################################
+# Stream generation
+###################################################################################################
+
+def encode_loco(address):
+    if address < 100:
+        return (0x00, address)
+    return (0xC0 | (address >> 8), address & 0xFF)
+
+def random_loco(rng):
+    while True:
+        address = rng.randint(1, 9999)
+        if address != config.DEBUG_LOCO:
+            return encode_loco(address)
+
+def random_noise(rng):
+    # The debug trigger would open the menu and stall the engine
+    return bytes(rng.choice([b for b in range(256) if b != com.DEBUG_TRIGGER]) for _ in range(NOISE_LENGTH))
+
+GENERATORS = {
+    "speed": lambda rng: com.with_checksum((0xE4, 0x13) + random_loco(rng) + (rng.randint(0, 255),)),
+    "function": lambda rng: com.with_checksum(
+        (0xE4, rng.choice((0x20, 0x21, 0x22, 0x23, 0x28))) + random_loco(rng) + (rng.randint(0, 255),)
+    ),
+    "cv_select": lambda rng: com.with_checksum((0x22, 0x15, rng.randint(1, 255))),
+    "cv_read": lambda rng: com.with_checksum((0x21, 0x10)),
+    "cv_write": lambda rng: com.with_checksum((0x23, 0x16, rng.randint(1, 255), rng.randint(0, 255))),
+    "loco_info": lambda rng: com.with_checksum((0xE3, 0x00) + random_loco(rng)),
+    "function_info": lambda rng: com.with_checksum((0xE3, 0x09) + random_loco(rng)),
+    "pom": lambda rng: com.with_checksum(
+        (0xE6, 0x30) + random_loco(rng) + (0xEC, rng.randint(0, 255), rng.randint(0, 255))
+    ),
+    "ping": lambda rng: PING,
+    "noise": random_noise
+}
+
+def synthetic_messages(count, seed):
+    rng = random.Random(seed)
+    return {name: [generate(rng) for _ in range(count)] for name, generate in GENERATORS.items()}
+
+def is_unsafe(frame):
+    # Frames that would stop the engine or change its behaviour part way through a run
+    if len(frame) == 1:
+        return True
+
+    handler = alink.HANDLERS.get(alink.handler_key(frame))
+    if handler in (alink.locoFunctionHandler, alink.locoSpeedHandler):
+        return com.decode_loco_id(frame[2:4]) == config.DEBUG_LOCO
+    return False
+
+def recorded_messages(paths):
+    # Recorded streams are split at frame boundaries, with anything between frames kept as noise
+    messages = {}
+    for path in paths:
+        with open(path, "rb") as f:
+            data = f.read()
+
+        framer = Framer(alink.FRAMER.header_table)
+        start = 0
+        for frame, end in Simulator(framer).frames(data):
+            if is_unsafe(frame):
+                raise ValueError(f"{path}: stream contains {com.to_hex(frame)} which would interrupt the engine")
+
+            frame_start = end - len(frame)
+            if frame_start > start:
+                messages.setdefault("noise", []).append(data[start:frame_start])
+            handler = alink.HANDLERS.get(alink.handler_key(frame), alink.unrecognisedHandler)
+            messages.setdefault(HANDLER_TYPES.get(handler.__name__, "unrecognised"), []).append(frame)
+            start = end
+
+        if start < len(data):
+            messages.setdefault("noise", []).append(data[start:])
+
+    return messages
+
+
+###################################################################################################
+# Engine
+###################################################################################################
+
+class Simulator:
+    # Mirrors the engine's framer so that the number of ping replies a stream will produce is known
+    # before it's sent
+    def __init__(self, framer=None):
+        self.framer = framer or Framer(alink.FRAMER.header_table)
+
+    def frames(self, data):
+        view = memoryview(data)
+        i = 0
+        while True:
+            i += self.framer.feed(view[i:])
+            if self.framer.ready:
+                yield bytes(self.framer.frame), i
+                continue
+            if i >= len(data):
+                return
+
+    def fences(self, data):
+        count = 0
+        for frame, _ in self.frames(data):
+            if len(frame) > 1 and alink.HANDLERS.get(alink.handler_key(frame)) in FENCE_HANDLERS:
+                count += 1
+        return count
+
+    def fenced(self, data):
+        # Appends pings until the last one is seen to complete as a frame of its own, returning the
+        # stream and the number of ping replies it will produce
+        count = self.fences(data)
+        while True:
+            data += PING
+            last = None
+            for frame, end in self.frames(PING):
+                if alink.HANDLERS.get(alink.handler_key(frame)) in FENCE_HANDLERS:
+                    count += 1
+                last = (frame, end)
+
+            # The ping must have been framed from its own bytes, not from bytes left over before it
+            if last == (PING, len(PING)) and self.framer._retry_index >= len(self.framer._retry):
+                return data, count
+
+
+class Engine:
+    def __init__(self, engine, optimize):
+        self._store = tempfile.mkdtemp(prefix="alink-bench-")
+        args = [sys.executable]
+        if optimize:
+            args.append("-O")
+        args += ["-c", CHILD_SCRIPT.format(path=self._store, engine=engine)]
+        self._process = subprocess.Popen(
+            args,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE
+        )
+        self._in = self._process.stdin.fileno()
+        self._out = self._process.stdout.fileno()
+        self._replies = bytearray()
+        self._offset = 0
+        self.simulator = Simulator()
+
+        # Wait for the engine to start answering
+        self.exchange(b"")
+
+    def _write(self, data):
+        view = memoryview(data)
+        while view:
+            view = view[os.write(self._in, view):]
+
+    def wait_fences(self, count):
+        replies = self._replies
+        while count:
+            if self._offset < len(replies):
+                length = frame_length(replies[self._offset])
+                if self._offset + length <= len(replies):
+                    if replies[self._offset] == 0x62 and replies[self._offset + 1] == 0x22:
+                        count -= 1
+                    self._offset += length
+                    continue
+
+            # Consumed replies are discarded before reading more so the buffer stays small
+            del replies[:self._offset]
+            self._offset = 0
+            data = os.read(self._out, 65536)
+            if not data:
+                raise EOFError("Engine exited")
+            replies += data
+
+    def exchange(self, data):
+        data, fences = self.simulator.fenced(data)
+        start = time.perf_counter()
+        self._write(data)
+        self.wait_fences(fences)
+        return time.perf_counter() - start
+
+    def stream(self, data):
+        # The stream is written from a second thread so that replies can be read while it's sent
+        data, fences = self.simulator.fenced(data)
+        writer = threading.Thread(target=self._write, args=(data,))
+        start = time.perf_counter()
+        writer.start()
+        self.wait_fences(fences)
+        elapsed = time.perf_counter() - start
+        writer.join()
+        return elapsed
+
+    def close(self):
+        self._process.stdin.close()
+        self._process.wait()
+        self._process.stdout.close()
+        shutil.rmtree(self._store, ignore_errors=True)
+
+
+###################################################################################################
+# Benchmark
+###################################################################################################
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+def measure(engine, messages):
+    latencies = [engine.exchange(message) for message in messages]
+    elapsed = engine.stream(b"".join(messages))
+    return {
+        "messages": len(messages),
+        "msgs_per_s": round(len(messages) / elapsed, 1),
+        "p50_us": round(percentile(latencies, 0.5) * 1000000, 1),
+        "p99_us": round(percentile(latencies, 0.99) * 1000000, 1)
+    }
+
+def run(args):
+    if args.replay:
+        messages = recorded_messages(args.replay)
+    else:
+        messages = synthetic_messages(args.count, args.seed)
+
+    mixed = [message for group in messages.values() for message in group]
+    random.Random(args.seed).shuffle(mixed)
+    messages["mixed"] = mixed
+
+    engine = Engine("alink_async" if args.use_async else "alink", args.optimize)
+    try:
+        types = {name: measure(engine, group) for name, group in messages.items()}
+    finally:
+        engine.close()
+
+    return {
+        "version": alink.VERSION,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "engine": "async" if args.use_async else "sync",
+        "optimize": args.optimize,
+        "source": args.replay or "synthetic",
+        "types": types
+    }
+
+def report(results, baseline=None):
+    print(f"alink {results['version']} {results['engine']} engine, Python {results['python']}"
+          f"{' -O' if results['optimize'] else ''}")
+    print(f"  {'type':14s} {'count':>7s} {'msgs/s':>10s} {'p50 us':>9s} {'p99 us':>9s}")
+    for name, row in results["types"].items():
+        line = f"  {name:14s} {row['messages']:7d} {row['msgs_per_s']:10.0f} {row['p50_us']:9.1f} {row['p99_us']:9.1f}"
+        old = baseline and baseline["types"].get(name)
+        if old:
+            line += f"  msgs/s {change(old['msgs_per_s'], row['msgs_per_s'])} p99 {change(old['p99_us'], row['p99_us'])}"
+        print(line)
+
+def change(old, new):
+    return f"{(new - old) / old * 100:+6.1f}%" if old else "     -"
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay XpressNet streams through alink")
+    parser.add_argument("--count", type=int, default=DEFAULT_COUNT, help="generated messages per type")
+    parser.add_argument("--seed", type=int, default=SEED)
+    parser.add_argument("--replay", nargs="+", metavar="FILE", help="recorded byte streams to replay")
+    parser.add_argument("--async", dest="use_async", action="store_true", help="run the asyncio engine")
+    parser.add_argument("-O", dest="optimize", action="store_true", help="run the engine with -O")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT, help="where to save the results as JSON")
+    parser.add_argument("--compare", metavar="FILE", help="earlier results to compare against")
+    args = parser.parse_args()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+    results = run(args)
+    report(results, baseline)
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results saved to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+# Scheduler microbenchmark.
+#
+# The "queue" benchmark queues a batch of jobs at random times in the past and then drains them with
+# a single call to do_events(). The "legacy" mode reproduces the original sorted list
+# implementation for comparison.
+#
+# The "expire" benchmark queues a batch of short timers spread over the next second and then steps a
+# simulated clock forward a millisecond at a time, comparing the heap with the timer wheel.
+#
+# Usage: python bench_scheduler.py [job count]
+import random
+import sys
+import time
+import scheduler
+
+DEFAULT_JOB_COUNT = 10000
+EXPIRE_WINDOW_MS = 1000
+WHEEL_SLOTS = 256
+WHEEL_RESOLUTION_MS = 1
+
+
+class LegacyScheduler:
+    def __init__(self):
+        self._events = []
+
+    def do_events(self):
+        t = scheduler.now()
+        while self._events and self._events[0][0] < t:
+            event = self._events.pop(0)
+            event[1](*event[2])
+
+    def run_at(self, at, cb, args=()):
+        event = (at, cb, args)
+        if not self._events or self._events[-1][0] <= at:
+            self._events.append(event)
+            return
+
+        i = len(self._events) - 1
+        while i != 0 and self._events[i-1][0] > at:
+            i -= 1
+
+        self._events.insert(i, event)
+
+
+class Counter:
+    def __init__(self):
+        self.fired = 0
+
+    def __call__(self):
+        self.fired += 1
+
+
+def _bench_queue(name, run_at, do_events, times, cancel=False):
+    cb = Counter()
+
+    start = time.perf_counter()
+    jobs = [run_at(at, cb) for at in times]
+    queued = time.perf_counter()
+    if cancel:
+        for job in jobs[::2]:
+            job.cancel()
+    do_events()
+    drained = time.perf_counter()
+
+    print(f"  {name:10s} queue {queued - start:8.4f}s  drain {drained - queued:8.4f}s  fired {cb.fired}")
+
+def _bench_expire(name, offsets):
+    cb = Counter()
+    clock = [0]
+    real_now = scheduler.now
+    scheduler.now = lambda: clock[0]
+    try:
+        if name == "wheel":
+            scheduler.set_timer_wheel(WHEEL_SLOTS, WHEEL_RESOLUTION_MS)
+
+        start = time.perf_counter()
+        for offset in offsets:
+            scheduler.run_at(offset, cb)
+        queued = time.perf_counter()
+
+        for t in range(EXPIRE_WINDOW_MS + 2):
+            clock[0] = t
+            scheduler.do_events()
+        drained = time.perf_counter()
+    finally:
+        scheduler.now = real_now
+
+    ticks = EXPIRE_WINDOW_MS + 2
+    per_tick = (drained - queued) / ticks * 1000000
+    print(f"  {name:10s} queue {queued - start:8.4f}s  expire {drained - queued:8.4f}s  {per_tick:8.2f}us/tick  fired {cb.fired}")
+
+def main():
+    job_count = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_JOB_COUNT
+    random.seed(0)
+
+    # All of the jobs are due in the past so that a single do_events() call runs them all
+    t = scheduler.now()
+    times = [t - random.randint(1, 1000) for _ in range(job_count)]
+
+    print(f"Queuing {job_count} jobs")
+    legacy = LegacyScheduler()
+    _bench_queue("legacy", legacy.run_at, legacy.do_events, times)
+    _bench_queue("heap", scheduler.run_at, scheduler.do_events, times)
+    _bench_queue("cancelled", scheduler.run_at, scheduler.do_events, times, cancel=True)
+
+    offsets = [random.randint(1, EXPIRE_WINDOW_MS) for _ in range(job_count)]
+
+    print(f"Expiring {job_count} timers over {EXPIRE_WINDOW_MS}ms")
+    _bench_expire("heap", offsets)
+    _bench_expire("wheel", offsets)
+
+if __name__ == "__main__":
+    main()
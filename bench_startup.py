@@ -0,0 +1,77 @@
+# Startup benchmark, measuring the time from starting the command station to its first valid reply.
+#
+# On desktop main.py is started in a child process with pings already waiting on stdin, and the time
+# is taken from launching the process to the first ping reply. With --port the Pico on that serial
+# port is soft reset instead, and pinged every few milliseconds until it answers. That needs pyserial.
+#
+# Usage: python bench_startup.py [--port PORT] [run count]
+import subprocess
+import sys
+import time
+
+DEFAULT_RUN_COUNT = 10
+PING = bytes((0x21, 0x24, 0x05))
+PING_REPLY = bytes((0x62, 0x22, 0x40, 0x00))
+PING_INTERVAL = 0.002
+TIMEOUT = 10
+
+
+def desktop_startup():
+    start = time.perf_counter()
+    child = subprocess.Popen(
+        [sys.executable, "main.py"],
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL
+    )
+    child.stdin.write(PING)
+    child.stdin.flush()
+
+    # Log lines come out on stdout too, but can't contain the reply's NUL
+    output = b""
+    while PING_REPLY not in output:
+        data = child.stdout.read1(4096)
+        if not data:
+            raise EOFError("Engine exited before replying")
+        output += data
+    elapsed = time.perf_counter() - start
+
+    child.stdin.close()
+    child.wait()
+    child.stdout.close()
+    return elapsed
+
+def pico_startup(port):
+    import serial
+
+    with serial.Serial(port, timeout=0) as device:
+        # Interrupt whatever is running and soft reset, which runs main.py again
+        device.write(b"\x03\x03")
+        time.sleep(0.1)
+        device.reset_input_buffer()
+        start = time.perf_counter()
+        device.write(b"\x04")
+
+        output = b""
+        while PING_REPLY not in output:
+            if time.perf_counter() - start > TIMEOUT:
+                raise TimeoutError("No reply from device")
+            device.write(PING)
+            time.sleep(PING_INTERVAL)
+            output = output[-len(PING_REPLY):] + device.read(4096)
+        return time.perf_counter() - start
+
+def main():
+    args = sys.argv[1:]
+    port = None
+    if args[:1] == ["--port"]:
+        port = args[1]
+        args = args[2:]
+    run_count = int(args[0]) if args else DEFAULT_RUN_COUNT
+
+    print(f"Time to first reply over {run_count} runs{f' on {port}' if port else ''}")
+    times = sorted(pico_startup(port) if port else desktop_startup() for _ in range(run_count))
+    print(f"  min {times[0] * 1000:8.1f}ms  median {times[len(times) // 2] * 1000:8.1f}ms  max {times[-1] * 1000:8.1f}ms")
+
+if __name__ == "__main__":
+    main()
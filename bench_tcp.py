@@ -0,0 +1,144 @@
+# Load test for the TCP front end.
+#
+# Starts alink_tcp in a child process and drives it from increasing numbers of concurrent clients,
+# all handled from a single thread with selectors. Each client alternates ping and loco info
+# requests, keeping a fixed number of them outstanding, and the benchmark reports the total
+# throughput and request to reply latency for each client count.
+#
+# Usage: python bench_tcp.py [requests per client] [window]
+import selectors
+import socket
+import subprocess
+import sys
+import time
+
+import config
+config.STDOUT_LOGGER = False
+
+import com
+from framer import frame_length
+
+CLIENT_COUNTS = (1, 4, 16, 64, 256)
+DEFAULT_REQUESTS = 200
+DEFAULT_WINDOW = 1
+CONNECT_TIMEOUT = 5
+
+REQUESTS = (
+    com.with_checksum((0x21, 0x24)),
+    com.with_checksum((0xE3, 0x00, 0x00, 0x03))
+)
+
+CHILD_SCRIPT = """
+import config
+config.STDOUT_LOGGER = False
+import alink_tcp
+alink_tcp.main({port})
+"""
+
+
+class Client:
+    def __init__(self, port, requests):
+        self.sock = socket.create_connection(("127.0.0.1", port))
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.sock.setblocking(False)
+        self.remaining = requests
+        self.outstanding = []
+        self.replies = bytearray()
+        self.latencies = []
+        self._next = 0
+
+    def send(self, window):
+        data = bytearray()
+        now = time.perf_counter()
+        while self.remaining and len(self.outstanding) < window:
+            data += REQUESTS[self._next]
+            self._next ^= 1
+            self.remaining -= 1
+            self.outstanding.append(now)
+        if data:
+            self.sock.sendall(data)
+
+    def receive(self):
+        data = self.sock.recv(65536)
+        if not data:
+            raise EOFError("Server closed the connection")
+
+        self.replies += data
+        now = time.perf_counter()
+        while self.replies and len(self.replies) >= frame_length(self.replies[0]):
+            del self.replies[:frame_length(self.replies[0])]
+            self.latencies.append(now - self.outstanding.pop(0))
+
+    @property
+    def done(self):
+        return not self.remaining and not self.outstanding
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def wait_for_server(port):
+    deadline = time.monotonic() + CONNECT_TIMEOUT
+    while True:
+        try:
+            socket.create_connection(("127.0.0.1", port)).close()
+            return
+        except ConnectionRefusedError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.05)
+
+def run(port, client_count, requests, window):
+    clients = [Client(port, requests) for _ in range(client_count)]
+    selector = selectors.DefaultSelector()
+    for client in clients:
+        selector.register(client.sock, selectors.EVENT_READ, client)
+
+    start = time.perf_counter()
+    for client in clients:
+        client.send(window)
+
+    active = client_count
+    while active:
+        for key, _ in selector.select():
+            client = key.data
+            client.receive()
+            if client.done:
+                selector.unregister(client.sock)
+                active -= 1
+            else:
+                client.send(window)
+    elapsed = time.perf_counter() - start
+
+    for client in clients:
+        client.sock.close()
+    selector.close()
+
+    latencies = [latency for client in clients for latency in client.latencies]
+    return len(latencies) / elapsed, percentile(latencies, 0.5), percentile(latencies, 0.99)
+
+def main():
+    requests = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_REQUESTS
+    window = int(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_WINDOW
+
+    port = free_port()
+    server = subprocess.Popen([sys.executable, "-c", CHILD_SCRIPT.format(port=port)], stdout=subprocess.DEVNULL)
+    try:
+        wait_for_server(port)
+        print(f"{requests} requests per client, {window} outstanding")
+        print(f"  {'clients':>7s} {'msgs/s':>10s} {'p50 us':>9s} {'p99 us':>9s}")
+        for client_count in CLIENT_COUNTS:
+            rate, p50, p99 = run(port, client_count, requests, window)
+            print(f"  {client_count:7d} {rate:10.0f} {p50 * 1000000:9.1f} {p99 * 1000000:9.1f}")
+    finally:
+        server.terminate()
+        server.wait()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+# pyright: reportMissingImports=false
+import struct
+import config
+import scheduler
+
+###################################################################################################
+# Wire capture
+# Every run of bytes com receives or sends is recorded with its direction and the time since the
+# previous record. The trace starts with a header holding the position of the oldest record and the
+# number of bytes in use, followed by a ring of records stored back to back as:
+#   4 bytes  microseconds since the previous record, saturating
+#   2 bytes  length of the data, with the top bit set for transmitted data
+#   data
+# The oldest records are dropped to make space for new ones. On the Pico the trace is held in RAM
+# and can be saved from the debug menu, on desktop it's a memory mapped file.
+###################################################################################################
+
+MAGIC = b"ACAP"
+VERSION = 1
+
+# Magic, version and padding, then the start and used fields
+_HEADER = 16
+_HEADER_FORMAT = "<4sB3xII"
+_RECORD_HEADER = 6
+_RECORD_FORMAT = "<IH"
+
+RX = 0
+TX = 0x8000
+_MAX_LENGTH = 0x7FFF
+_MAX_DELTA = 0xFFFFFFFF
+
+# MicroPython's microsecond ticks wrap after about 18 minutes, so longer gaps are timed with the
+# scheduler's millisecond counter instead
+_LONG_GAP_MS = 60000
+
+_buffer = None
+_size = 0
+_start = 0
+_used = 0
+_last = 0
+_last_ms = 0
+_record = bytearray(_RECORD_HEADER)
+
+def start(size=None, path=None):
+    global _buffer, _size, _start, _used, _last, _last_ms
+    size = size or config.CAPTURE_SIZE
+    try:
+        import mmap
+        with open(path or config.CAPTURE_PATH, "w+b") as f:
+            f.truncate(_HEADER + size)
+            _buffer = mmap.mmap(f.fileno(), _HEADER + size)
+    except ImportError:
+        _buffer = bytearray(_HEADER + size)
+
+    _size = size
+    _start = 0
+    _used = 0
+    _last = scheduler.ticks_us()
+    _last_ms = scheduler.now()
+    _write_header()
+
+def _write_header():
+    struct.pack_into(_HEADER_FORMAT, _buffer, 0, MAGIC, VERSION, _start, _used)
+
+def _copy_in(p, data):
+    # Copies data into the ring at p, returning the position after it
+    length = len(data)
+    first = min(length, _size - p)
+    _buffer[_HEADER + p:_HEADER + p + first] = data[:first]
+    if first < length:
+        _buffer[_HEADER:_HEADER + length - first] = data[first:]
+    return (p + length) % _size
+
+def _drop_oldest():
+    global _start, _used
+    p = (_start + 4) % _size
+    length = _buffer[_HEADER + p] | (_buffer[_HEADER + (p + 1) % _size] << 8)
+    size = _RECORD_HEADER + (length & _MAX_LENGTH)
+    _start = (_start + size) % _size
+    _used -= size
+
+def record(direction, data):
+    global _used, _last, _last_ms
+    now = scheduler.ticks_us()
+    now_ms = scheduler.now()
+    if now_ms - _last_ms >= _LONG_GAP_MS:
+        delta = min((now_ms - _last_ms) * 1000, _MAX_DELTA)
+    else:
+        delta = max(0, scheduler.ticks_diff(now, _last))
+    _last = now
+    _last_ms = now_ms
+
+    length = min(len(data), _MAX_LENGTH, _size - _RECORD_HEADER)
+    while _size - _used < _RECORD_HEADER + length:
+        _drop_oldest()
+
+    struct.pack_into(_RECORD_FORMAT, _record, 0, delta, direction | length)
+    p = _copy_in((_start + _used) % _size, _record)
+    _copy_in(p, data[:length])
+    _used += _RECORD_HEADER + length
+    _write_header()
+
+def save(out):
+    path = config.CAPTURE_PATH
+    out(f"Saving capture to {path}")
+    with open(path, "wb") as f:
+        f.write(_buffer)
+
+def records(trace):
+    # Decodes a saved trace, yielding the time since the previous record in microseconds, the
+    # direction and the data of each record, oldest first
+    magic, version, p, remaining = struct.unpack_from(_HEADER_FORMAT, trace, 0)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("Not a capture trace")
+
+    ring = bytes(trace[_HEADER:])
+    ring += ring
+    size = len(trace) - _HEADER
+    while remaining:
+        delta, length = struct.unpack_from(_RECORD_FORMAT, ring, p)
+        direction = length & TX
+        length &= _MAX_LENGTH
+        data = ring[p + _RECORD_HEADER:p + _RECORD_HEADER + length]
+        yield delta, direction, data
+        p = (p + _RECORD_HEADER + length) % size
+        remaining -= _RECORD_HEADER + length
@@ -0,0 +1,56 @@
+# Replays a wire capture trace recorded by com.
+#
+# The received bytes in the trace are written to stdout so that they can be piped straight back into
+# the engine, either with their original timing or as fast as possible:
+#
+#   python capture_replay.py capture.bin | python alink.py
+#   python capture_replay.py --fast capture.bin | python alink.py
+#
+# --list prints every record in the trace, received and transmitted, instead.
+#
+# Usage: python capture_replay.py [--fast | --list] trace
+import sys
+import time
+import capture
+
+
+def list_trace(trace):
+    elapsed = 0
+    for delta, direction, data in capture.records(trace):
+        elapsed += delta
+        name = "TX" if direction == capture.TX else "RX"
+        print(f"{elapsed / 1000000:12.6f} {name} {data.hex(' ')}")
+
+def replay(trace, fast):
+    out = sys.stdout.buffer
+    due = time.perf_counter()
+    for delta, direction, data in capture.records(trace):
+        due += delta / 1000000
+        if direction != capture.RX:
+            continue
+
+        if not fast:
+            wait = due - time.perf_counter()
+            if wait > 0:
+                out.flush()
+                time.sleep(wait)
+
+        out.write(data)
+    out.flush()
+
+def main():
+    args = sys.argv[1:]
+    if len(args) != 2 and (len(args) != 1 or args[0].startswith("--")):
+        print("Usage: python capture_replay.py [--fast | --list] trace", file=sys.stderr)
+        sys.exit(1)
+
+    with open(args[-1], "rb") as f:
+        trace = f.read()
+
+    if args[0] == "--list":
+        list_trace(trace)
+    else:
+        replay(trace, args[0] == "--fast")
+
+if __name__ == "__main__":
+    main()
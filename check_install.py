@@ -0,0 +1,94 @@
+# Checks install.py against fake_mpremote.py, with no Pico attached.
+#
+# Installs to a few fake devices in parallel and checks that every file arrives in a single session
+# per device, that a second install copies nothing, and that only a changed file is copied again.
+#
+# Usage: python check_install.py [device count]
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+import install
+
+DEFAULT_DEVICE_COUNT = 3
+
+failures = 0
+
+
+def check(condition, message):
+    global failures
+    if not condition:
+        failures += 1
+        print(f"FAIL: {message}")
+
+def run_install(root, *args):
+    env = dict(os.environ, FAKE_MPREMOTE_DIR=root, MPREMOTE=f'"{sys.executable}" fake_mpremote.py')
+    result = subprocess.run([sys.executable, "install.py"] + list(args), env=env, capture_output=True, text=True)
+    check(result.returncode == 0, f"install.py {' '.join(args)} exited with {result.returncode}\n{result.stderr}")
+    return result.stdout
+
+def sessions(root, device):
+    path = os.path.join(root, device + ".log")
+    if not os.path.exists(path):
+        return []
+    with open(path) as log:
+        return log.read().splitlines()
+
+def copy_sessions(root, device):
+    return [session for session in sessions(root, device) if session.startswith("fs cp")]
+
+def main():
+    device_count = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_DEVICE_COUNT
+    created_config = not os.path.exists(install.PICO_CONFIG_NAME)
+
+    with tempfile.TemporaryDirectory() as root:
+        devices = [f"dev{i}" for i in range(device_count)]
+        for device in devices:
+            os.mkdir(os.path.join(root, device))
+
+        # First install copies everything in one session per device, skipping ports that aren't Picos
+        output = run_install(root, "--all")
+        check(f"Installing pico-alink to {', '.join(devices)}..." in output, f"--all didn't pick out just the Picos\n{output}")
+        for device in devices:
+            check(len(copy_sessions(root, device)) == 1, f"{device} took more than one session to install")
+            for source, dest in install.build_file_list(False, False):
+                path = os.path.join(root, device, dest)
+                check(os.path.exists(path), f"{dest} is missing from {device}")
+                check(install.file_hash(path) == install.file_hash(source), f"{dest} differs on {device}")
+
+        # Nothing changed, so nothing is copied
+        output = run_install(root, "--all")
+        check(output.count("up to date") == device_count, "second install wasn't up to date")
+        for device in devices:
+            check(len(copy_sessions(root, device)) == 1, f"{device} was copied to again")
+
+        # A changed file, and a stale one from an earlier install, on a single device
+        device = devices[0]
+        manifest_path = os.path.join(root, device, install.MANIFEST_NAME)
+        with open(manifest_path) as file:
+            manifest = json.load(file)
+        manifest["alink.py"] = "0" * 16
+        manifest["old.py"] = "0" * 16
+        with open(os.path.join(root, device, "old.py"), "w") as file:
+            file.write("")
+        with open(manifest_path, "w") as file:
+            json.dump(manifest, file)
+
+        output = run_install(root, "--device", device)
+        latest = copy_sessions(root, device)[-1]
+        check(latest.count("fs cp") == 2, f"expected alink.py and the manifest to be copied, got: {latest}")
+        check("alink.py" in latest, "alink.py wasn't copied again")
+        check(not os.path.exists(os.path.join(root, device, "old.py")), "old.py wasn't removed")
+        for other in devices[1:]:
+            check(len(copy_sessions(root, other)) == 1, f"{other} was copied to when it wasn't selected")
+
+    if created_config:
+        os.remove(install.PICO_CONFIG_NAME)
+
+    print(f"{failures} failures")
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
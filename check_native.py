@@ -0,0 +1,130 @@
+# Parity checks for the compiled hot routines in native_micropy.py.
+#
+# Runs each compiled routine and the pure Python version it replaces over the same inputs and
+# reports any difference. It needs to run under MicroPython, on the device after installing or with
+# the unix port from this directory:
+#
+#   mpremote run check_native.py
+#   micropython check_native.py
+#
+# Usage: micropython check_native.py [stream count]
+# pyright: reportMissingImports=false
+import random
+import sys
+
+if sys.implementation.name != "micropython":
+    print("The compiled variants can only be checked under MicroPython")
+    sys.exit(1)
+
+import config
+config.STDOUT_LOGGER = False
+
+import native_micropy
+import alink
+import com
+import framer
+
+DEFAULT_STREAM_COUNT = 200
+STREAM_LENGTH = 64
+
+failures = 0
+
+
+def check(name, expected, actual, data):
+    global failures
+    if expected != actual:
+        failures += 1
+        if failures <= 10:
+            print(f"FAIL {name}({data}): expected {expected}, got {actual}")
+
+def random_bytes(length):
+    return bytes(random.getrandbits(8) for _ in range(length))
+
+def check_checksum():
+    for length in range(framer.MAX_FRAME_LENGTH + 1):
+        for _ in range(50):
+            data = random_bytes(length)
+            expected = com.py_calc_checksum(data)
+            check("calc_checksum", expected, native_micropy.calc_checksum(data), data)
+            check("calc_checksum", expected, native_micropy.calc_checksum(tuple(data)), data)
+            check("calc_checksum", expected, native_micropy.calc_checksum(memoryview(bytearray(data))), data)
+
+def check_loco_id():
+    frame = bytearray(5)
+    view = memoryview(frame)
+    for high in range(256):
+        for low in range(256):
+            frame[2] = high
+            frame[3] = low
+            expected = com.py_decode_loco_id(view[2:4])
+            check("decode_loco_id", expected, native_micropy.decode_loco_id(view[2:4]), (high, low))
+            check("decode_loco_id", expected, native_micropy.decode_loco_id(bytes(frame[2:4])), (high, low))
+
+def check_functions():
+    for bank, functions in alink.FUNCTIONS.items():
+        for changed in (0x00, 0x01, 0x5A, 0x80, 0xFF):
+            for state in range(256):
+                expected = []
+                actual = []
+                alink.py_for_each_function(functions, changed, state, lambda f, active: expected.append((f, active)))
+                native_micropy.for_each_function(functions, changed, state, lambda f, active: actual.append((f, active)))
+                check("for_each_function", expected, actual, (bank, changed, state))
+
+class PyFramer(framer.Framer):
+    feed = framer.py_feed
+    _push = framer.py_push
+
+class NativeFramer(framer.Framer):
+    feed = native_micropy.framer_feed
+    _push = native_micropy.framer_push
+
+def random_stream():
+    # Mostly valid frames with corrupted checksums and noise mixed in
+    sequences = [sequence for sequence, _ in alink.ROOT_HANDLERS if len(sequence) > 1]
+    stream = bytearray()
+    while len(stream) < STREAM_LENGTH:
+        kind = random.getrandbits(2)
+        if kind == 0:
+            stream += random_bytes(random.getrandbits(3))
+            continue
+
+        sequence = sequences[random.getrandbits(8) % len(sequences)]
+        data = bytes(sequence) + random_bytes(framer.frame_length(sequence[0]) - len(sequence) - 1)
+        frame = com.with_checksum(data)
+        if kind == 1:
+            frame = frame[:-1] + bytes((frame[-1] ^ 0xFF,))
+        stream += frame
+    return bytes(stream)
+
+def run_framer(framer_class, stream):
+    f = framer_class(alink.FRAMER.header_table)
+    frames = []
+    view = memoryview(stream)
+    i = 0
+    while True:
+        i += f.feed(view[i:])
+        if f.ready:
+            frames.append((bytes(f.frame), i))
+            continue
+        if i >= len(stream):
+            return frames, f.dropped
+
+def check_framer(count):
+    for _ in range(count):
+        stream = random_stream()
+        check("Framer.feed", run_framer(PyFramer, stream), run_framer(NativeFramer, stream), stream)
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_STREAM_COUNT
+
+    check_checksum()
+    check_loco_id()
+    check_functions()
+    check_framer(count)
+
+    if failures:
+        print(f"{failures} differences found")
+        sys.exit(1)
+    print("Compiled variants match")
+
+main()
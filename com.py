@@ -1,12 +1,42 @@
-from sys import stdin, stdout
-from debug import add_stat, inc_stat, IS_MICROPYTHON
-import log
+from debug import add_stat, register_stat, IS_MICROPYTHON
+import config
 
 if IS_MICROPYTHON:
     import eventcom_micropy as eventcom
 else:
     import eventcom_desktop as eventcom
 
+# Everything received and sent is recorded when wire capture is enabled
+if config.CAPTURE_SIZE:
+    import capture
+    capture.start()
+else:
+    capture = None
+
+STAT_READ = register_stat("Read")
+STAT_WRITTEN = register_stat("Written")
+
+# Size of the receive ring buffer, must be a power of two
+RX_BUFFER_SIZE = 256
+_RX_MASK = RX_BUFFER_SIZE - 1
+
+_rx = bytearray(RX_BUFFER_SIZE)
+_rx_view = memoryview(_rx)
+_rx_start = 0
+_rx_count = 0
+
+# Replies are collected in the transmit buffer and sent with a single write by flush()
+TX_BUFFER_SIZE = 64
+
+_tx = bytearray(TX_BUFFER_SIZE)
+_tx_view = memoryview(_tx)
+_tx_count = 0
+
+# Where flushed replies are sent, engines that serve more than one stream switch this per message
+_writer = eventcom.write
+
+DEBUG_TRIGGER = ord("~")
+
 def to_hex(buffer):
     return " ".join([hex(v) for v in buffer])
 
@@ -22,43 +52,154 @@ def calc_checksum(data):
         checkSum ^= v
     return checkSum & 0xFF
 
-def is_valid_message(buffer, checksum):
-    if checksum == calc_checksum(buffer):
-        return True
+# Compiled variants, see native_micropy
+py_decode_loco_id = decode_loco_id
+py_calc_checksum = calc_checksum
+if IS_MICROPYTHON and config.NATIVE_CODE:
+    from native_micropy import decode_loco_id, calc_checksum
+
+
+###################################################################################################
+# Receive ring buffer
+# Everything available on stdin is drained into the ring in a single call and messages are then
+# parsed out of the ring rather than through individual stream reads.
+###################################################################################################
+
+def available():
+    return _rx_count
 
-    log.error("Checksum failed")
-    log.warn(f"Msg: {to_hex(buffer)}")
+def feed(data):
+    global _rx_count
+    length = len(data)
+    if length > RX_BUFFER_SIZE - _rx_count:
+        raise IOError("Receive buffer overflow")
 
-    return False
+    end = (_rx_start + _rx_count) & _RX_MASK
+    first = min(length, RX_BUFFER_SIZE - end)
+    _rx_view[end:end + first] = data[:first]
+    if first < length:
+        _rx_view[:length - first] = data[first:]
 
-def read(length):
-    data = stdin.buffer.read(length)
-    if (isinstance(data, str)):
-        data = [ord(d) for d in data]
+    _rx_count += length
+    add_stat(STAT_READ, length)
+    if capture:
+        capture.record(capture.RX, data)
 
-    add_stat("Read", len(data))
-    return data
+def fill(event_cb=None, period=None, due=None, wanted=1):
+    # Reads at least wanted bytes if there's space for them, along with anything else available
+    global _rx_count
+    end = _rx_start + _rx_count
+    if end >= RX_BUFFER_SIZE:
+        end -= RX_BUFFER_SIZE
+        space = _rx_start - end
+    else:
+        space = RX_BUFFER_SIZE - end
+
+    if space == 0:
+        return 0
+
+    count = eventcom.read_into(_rx_view[end:end + space], event_cb, period, due, wanted)
+    _rx_count += count
+    add_stat(STAT_READ, count)
+    if capture:
+        capture.record(capture.RX, _rx_view[end:end + count])
+    return count
 
 def read_byte(event_cb=None, period=None):
+    global _rx_start, _rx_count
     if event_cb:
         event_cb()
-        b = eventcom.read_byte(event_cb, period)
-        inc_stat("Read")
-        return b
-    return read(1)[0]
 
-def read_into_buffer(buffer, length=1):
-    data = read(length)
-    buffer.extend(data)
-    return data
+    while _rx_count == 0:
+        fill(event_cb, period)
+
+    b = _rx[_rx_start]
+    _rx_start = (_rx_start + 1) & _RX_MASK
+    _rx_count -= 1
+    return b
+
+def next_frame(framer):
+    # Feeds buffered bytes to the framer without blocking, returning the next complete frame or
+    # None if the buffer runs out first
+    global _rx_start, _rx_count
+    while True:
+        end = min(_rx_start + _rx_count, RX_BUFFER_SIZE)
+        used = framer.feed(_rx_view[_rx_start:end])
+        _rx_start = (_rx_start + used) & _RX_MASK
+        _rx_count -= used
+        if framer.ready:
+            return framer.frame
+
+        if _rx_count == 0:
+            return None
+
+def read_frame(framer, event_cb=None, period=None):
+    # The event callback can return the number of milliseconds until it next needs calling
+    due = event_cb() if event_cb else None
+
+    while True:
+        frame = next_frame(framer)
+        if frame is not None:
+            return frame
+
+        fill(event_cb, period, due, framer.remaining())
+
+def with_checksum(data):
+    # Builds a complete reply, used to prepare constant replies up front
+    data = bytes(data)
+    return data + bytes((calc_checksum(data),))
+
+
+###################################################################################################
+# Transmit buffer
+###################################################################################################
 
 def write(data):
+    global _tx_count
     if isinstance(data, int):
-        data = [data]
-    data = bytes(data)
-    stdout.buffer.write(data)
-    add_stat("Written", len(data))
+        if _tx_count == TX_BUFFER_SIZE:
+            flush()
+        _tx[_tx_count] = data
+        _tx_count += 1
+        return
+
+    if isinstance(data, (tuple, list)):
+        data = bytes(data)
+
+    length = len(data)
+    if length > TX_BUFFER_SIZE - _tx_count:
+        flush()
+        if length > TX_BUFFER_SIZE:
+            _writer(data)
+            add_stat(STAT_WRITTEN, length)
+            if capture:
+                capture.record(capture.TX, data)
+            return
+
+    _tx_view[_tx_count:_tx_count + length] = data
+    _tx_count += length
+
+def write_reply(reply):
+    # Queues a reply prepared in a preallocated buffer, filling in the checksum in its last byte
+    checksum = 0
+    for i in range(len(reply) - 1):
+        checksum ^= reply[i]
+    reply[-1] = checksum
+    write(reply)
+
+def set_writer(writer):
+    # Anything still buffered belongs to the previous writer
+    global _writer
+    flush()
+    _writer = writer
+
+def flush():
+    global _tx_count
+    if _tx_count == 0:
+        return
 
-def write_with_checksum(data):
-    write(data)
-    write(calc_checksum(data))
+    _writer(_tx_view[:_tx_count])
+    add_stat(STAT_WRITTEN, _tx_count)
+    if capture:
+        capture.record(capture.TX, _tx_view[:_tx_count])
+    _tx_count = 0
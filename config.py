@@ -1,13 +1,40 @@
-#import lcd_rp2040lcd096
-
 MEM_LOG_SIZE = 1000
-#LCD_LOGGER = lcd_rp2040lcd096
+# Log levels for each sink: 0 = debug, 1 = info, 2 = warn, 3 = error
+MEM_LOG_LEVEL = 0
+LCD_LOG_LEVEL = 0
+STDOUT_LOG_LEVEL = 0
+#LCD_LOGGER = "lcd_rp2040lcd096"
 LCD_LOGGER = None
+LCD_LOG_WRAP = False
+LCD_MAX_FPS = 10
+LOG_THREAD = False
+LOG_QUEUE_SIZE = 32
+# Sends log lines to a UART ("uart:<id>"), file descriptor ("fd:<n>") or path instead of stdout
+LOG_TRANSPORT = None
+LOG_TRANSPORT_LEVEL = 1
+LOG_TRANSPORT_BAUD = 115200
+LOG_TRANSPORT_QUEUE = 2048
 STDOUT_LOGGER = True
 LOG_PING = False
 LED_PIN = 25
 LED_INITIAL_VALUE = 1
 SCHEDULER_PERIOD = 1000
+SCHEDULER_WHEEL_SLOTS = 0
+SCHEDULER_WHEEL_RESOLUTION = 10
+ASYNC_ENGINE = False
+TCP_HOST = "127.0.0.1"
+TCP_PORT = 0
+HANDLER_PROFILING = False
+NATIVE_CODE = True
+LOW_GC = False
+GC_IDLE_PERIOD = 50
+GC_MIN_FREE = 8192
+CAPTURE_SIZE = 0
+CAPTURE_PATH = "capture.bin"
 
 DEVICE_VERSION = 107
 DEBUG_LOCO = 9999
+LOCO_TABLE_SIZE = 16384
+CV_STORE_PATH = "cvs"
+CV_FLUSH_DELAY = 5
+CV_FLUSH_BATCH = 4
@@ -0,0 +1,126 @@
+import config
+import log
+import os
+import scheduler
+from debug import inc_stat, register_stat
+
+# CVs are held in a 256 byte page per loco, indexed by CV number as sent by the throttle. Pages are
+# loaded from the filesystem the first time a loco's CVs are used. Writes go into the page and the
+# loco is added to the journal of dirty pages, which a scheduled job writes back in batches so
+# that flash writes stay off the reply path and repeated writes to a page only cost one flash write.
+PAGE_SIZE = 256
+
+# Page used for service mode programming, where there's no loco address
+SERVICE_TRACK = 0
+
+DEFAULT_CVS = {
+    1: 3,
+    3: 5,
+    4: 5,
+    7: 100,
+    8: 255,
+    10: 128,
+    29: 6
+}
+
+STAT_PAGES_LOADED = register_stat("CV pages loaded")
+STAT_PAGES_CREATED = register_stat("CV pages created")
+STAT_PAGES_WRITTEN = register_stat("CV pages written")
+
+_pages = {}
+_journal = []
+_flush_job = None
+
+def _page_path(loco):
+    return f"{config.CV_STORE_PATH}/{loco}.bin"
+
+def _load(loco):
+    page = bytearray(PAGE_SIZE)
+    _pages[loco] = page
+
+    if config.CV_STORE_PATH:
+        try:
+            with open(_page_path(loco), "rb") as f:
+                f.readinto(page)
+            inc_stat(STAT_PAGES_LOADED)
+            return page
+        except OSError:
+            pass
+
+    for cv, value in DEFAULT_CVS.items():
+        page[cv] = value
+    inc_stat(STAT_PAGES_CREATED)
+    return page
+
+def _page(loco):
+    page = _pages.get(loco)
+    if page is None:
+        page = _load(loco)
+    return page
+
+def read(loco, cv):
+    return _page(loco)[cv]
+
+def write(loco, cv, value):
+    global _flush_job
+    page = _page(loco)
+    if page[cv] == value:
+        return
+    page[cv] = value
+
+    if not config.CV_STORE_PATH or loco in _journal:
+        return
+
+    _journal.append(loco)
+    if _flush_job is None:
+        _flush_job = scheduler.run_in(config.CV_FLUSH_DELAY, flush)
+
+
+###################################################################################################
+# Persistence
+###################################################################################################
+
+def _ensure_store():
+    try:
+        os.stat(config.CV_STORE_PATH)
+    except OSError:
+        os.mkdir(config.CV_STORE_PATH)
+
+def _write_page(loco):
+    # Write to a temporary file first so that a power cut can't leave a partial page behind
+    path = _page_path(loco)
+    temp = path + ".tmp"
+    with open(temp, "wb") as f:
+        f.write(_pages[loco])
+    os.rename(temp, path)
+    inc_stat(STAT_PAGES_WRITTEN)
+
+def flush(batch=None):
+    # Writes back up to a batch of dirty pages, rescheduling itself if there are more to go
+    global _flush_job
+    _flush_job = None
+    if not _journal:
+        return
+
+    # Pages only leave the journal once they've been written, so that a failed write is retried
+    batch = batch or config.CV_FLUSH_BATCH
+    written = 0
+    try:
+        _ensure_store()
+        while _journal and written < batch:
+            _write_page(_journal[0])
+            _journal.pop(0)
+            written += 1
+    except OSError as ex:
+        log.error("Failed to save CVs: %s", ex)
+
+    if written:
+        log.info("Saved CVs")
+    if _journal:
+        _flush_job = scheduler.run_in(config.CV_FLUSH_DELAY, flush)
+
+def flush_all():
+    global _flush_job
+    if _flush_job:
+        _flush_job.cancel()
+    flush(len(_journal))
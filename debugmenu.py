@@ -0,0 +1,133 @@
+# pyright: reportMissingImports=false
+# Debug menu and the actions behind it. Only loaded when the menu is first opened or an action is
+# used from the debug loco, so none of it slows down startup.
+from debug import IS_MICROPYTHON, BOOT_TIME, Terminated
+import config
+import debug
+import log
+import scheduler
+import sys
+import time
+
+
+###################################################################################################
+# Debug Menu Actions
+###################################################################################################
+
+def return_to_alink(out):
+    out("Returning to aLink mode")
+    return True
+
+def view_log(out):
+    import memlog
+    memlog.output(out)
+
+def view_stats(out):
+    ss = int(time.time() - BOOT_TIME)
+    mm = int(ss / 60)
+    ss -= (mm * 60)
+    out(f"Uptime: {mm:02d}:{ss:02d}")
+    out(f"Is Errored: {debug.is_errored}")
+    for name, value in debug.stat_items():
+        if value:
+            out(f"{name}: {value}")
+    if config.HANDLER_PROFILING:
+        import profiler
+        profiler.view(out)
+
+def mem_info(_):
+    import micropython
+    micropython.mem_info()
+
+def raise_exception(out):
+    out("Throwing exception...")
+    raise AssertionError("Test Exception")
+
+def schedule_message(out):
+    out("Scheduling test messae in 5 seconds")
+    scheduler.run_in(5, log.info, ("Test",))
+
+def schedule_exception(out):
+    out("Scheduling test exception in 5 seconds")
+    scheduler.run_in(5, raise_exception, (lambda _: None,))
+
+def toggle_error_state(out):
+    out(f"Requesting error state: {not debug.is_errored}")
+    debug.function_device_error(not debug.is_errored)
+
+def delete_mainpy(out):
+    try:
+        import os
+        os.stat("main.py")
+        out("Removing main.py")
+        os.remove("main.py")
+    except OSError:
+        out("main.py not found")
+
+def save_capture(out):
+    import com
+    if com.capture:
+        com.capture.save(out)
+    else:
+        out("Wire capture not enabled")
+
+def exit_script(out):
+    out("Exit requested")
+    raise Terminated()
+
+
+###################################################################################################
+# Debug Menu Handler
+###################################################################################################
+
+def should_display(item):
+    return item[3] == ALL or IS_MICROPYTHON
+
+def print_debug_menu():
+    print("")
+    print("Debug Menu:")
+    for item in DEBUG_MENU_ITEMS:
+        if should_display(item):
+            print(f"  {item[0]}) {item[1]}")
+    print("")
+
+def read_stdin_key():
+    return sys.stdin.read(1)
+
+def open_debug_menu(read_key=read_stdin_key):
+    while True:
+        print_debug_menu()
+
+        while True:
+            c = read_key()
+            action = DEBUG_ACTION_MAP.get(c)
+            if action is None:
+                continue
+
+            if action(print):
+                return
+
+            break
+
+ALL = object()
+MICROPYTHON = object()
+
+DEBUG_MENU_ITEMS = [
+    ("0", "Return to aLink mode", return_to_alink, ALL),
+    ("1", "View log", view_log, ALL),
+    ("2", "Stats", view_stats, ALL),
+    ("3", "Memory info", mem_info, MICROPYTHON),
+    ("4", "Toggle onboard led", lambda _: debug.led_toggle(), MICROPYTHON),
+    ("5", "Trigger exception", raise_exception, ALL),
+    ("6", "Schedule test message", schedule_message, ALL),
+    ("7", "Schedule test exception", schedule_exception, ALL),
+    ("8", "Toggle error state", toggle_error_state, ALL),
+    ("9", "Delete main.py", delete_mainpy, MICROPYTHON),
+    ("c", "Save wire capture", save_capture, MICROPYTHON),
+    ("x", "Exit script", exit_script, ALL)
+]
+
+DEBUG_ACTION_MAP = {}
+for item in DEBUG_MENU_ITEMS:
+    if should_display(item):
+        DEBUG_ACTION_MAP[item[0]] = item[2]
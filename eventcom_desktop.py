@@ -1,32 +1,74 @@
+import selectors
 import sys
 import time
-from debug import log_exception
-from threading import Thread, Event
+from debug import log_exception, Terminated
+
+# A single long lived selector is used to wait on stdin. The scheduler period is applied as the
+# select timeout and events are dispatched on the calling thread, so the tick keeps its phase
+# across reads. The callback can also ask to be called back sooner than its next tick.
+_selector = None
+_stdin = None
+_next_wake_time = None
+
+def _register():
+    global _selector, _stdin
+    _stdin = sys.stdin.buffer.raw
+    _selector = selectors.DefaultSelector()
+    try:
+        _selector.register(_stdin, selectors.EVENT_READ)
+    except (PermissionError, ValueError):
+        # Regular files can't be waited on, but they're also always readable
+        _selector = False
+
+def _wait_readable(event_cb, period, due):
+    global _next_wake_time
+    now = time.monotonic()
+    if _next_wake_time is None:
+        _next_wake_time = now + period
+    due_time = None if due is None else now + due / 1000
 
-def _event_thread_main(event_cb, period, exit_event):
-    next_wake_time = time.time() + period
     while True:
-        signaled = exit_event.wait(timeout=next_wake_time-time.time())
+        wake_time = _next_wake_time if due_time is None else min(_next_wake_time, due_time)
+        timeout = wake_time - now
+        if timeout > 0 and _selector.select(timeout):
+            return
 
-        if signaled:
-            break
+        now = time.monotonic()
+        if now < wake_time:
+            continue
 
+        due = None
         try:
-            event_cb()
+            due = event_cb()
         except Exception as ex:
             log_exception(ex)
+        due_time = None if due is None else now + due / 1000
+
+        if now >= _next_wake_time:
+            _next_wake_time += period
+            if _next_wake_time <= now:
+                # We've fallen more than a whole period behind, so skip the missed ticks
+                _next_wake_time = now + period
+
 
-        next_wake_time += period
+def read_into(buffer, event_cb=None, period_ms=None, due_ms=None, wanted=1):
+    if _selector is None:
+        _register()
 
+    if event_cb and _selector:
+        _wait_readable(event_cb, period_ms / 1000, due_ms)
 
-def read_byte(event_cb, period_ms):
-    exit_event = Event()
-    thread = Thread(target=_event_thread_main, args=(event_cb, period_ms/1000, exit_event), daemon=True)
-    thread.start()
+    # The raw stream returns whatever is available, up to the size of the buffer, in a single call,
+    # so there's no need to ask for the wanted number of bytes up front
+    count = _stdin.readinto(buffer)
+    if not count:
+        raise Terminated()
 
-    b = sys.stdin.buffer.read(1)[0]
+    return count
 
-    exit_event.set()
-    thread.join()
 
-    return b
+def write(data):
+    # Flush any pending text first so that log lines and replies stay in order
+    sys.stdout.flush()
+    sys.stdout.buffer.write(data)
+    sys.stdout.buffer.flush()
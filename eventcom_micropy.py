@@ -4,13 +4,48 @@ import sys
 _stdin_poll = select.poll()
 _stdin_poll.register(sys.stdin, select.POLLIN)
 
-def read_byte(event_cb, period_ms):
+_byte = bytearray(1)
+
+def _wait_readable(event_cb, period_ms, due_ms):
+    if not event_cb:
+        timeout = -1
+    elif due_ms is None:
+        timeout = period_ms
+    else:
+        timeout = min(period_ms, due_ms)
+
     while True:
-        ready = _stdin_poll.poll(period_ms)
+        ready = _stdin_poll.poll(timeout)
         if ready:
             state = ready[0][1]
             if state != select.POLLIN:
                 raise IOError(f"poll={state}")
-            return sys.stdin.buffer.read(1)[0]
+            return
+
+        # The callback can ask to be called back sooner than the usual period
+        due = event_cb()
+        timeout = period_ms if due is None else min(period_ms, due)
+
+def write(data):
+    sys.stdout.buffer.write(data)
+
+def read_into(buffer, event_cb=None, period_ms=None, due_ms=None, wanted=1):
+    _wait_readable(event_cb, period_ms, due_ms)
+
+    # The rest of a frame whose length is already known is read with a single blocking call, as it
+    # can only be moments behind the bytes already received
+    size = len(buffer)
+    count = min(wanted, size)
+    if count > 1:
+        sys.stdin.buffer.readinto(buffer[:count])
+    else:
+        count = 0
+
+    # Then drain whatever else is available without blocking. stdin can't say how much is waiting,
+    # so this has to go a byte at a time.
+    while count < size and (count == 0 or _stdin_poll.poll(0)):
+        sys.stdin.buffer.readinto(_byte)
+        buffer[count] = _byte[0]
+        count += 1
 
-        event_cb()
+    return count
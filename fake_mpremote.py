@@ -0,0 +1,85 @@
+# Stand-in for mpremote, used by check_install.py to exercise install.py without a Pico attached.
+#
+# Each device is a directory under FAKE_MPREMOTE_DIR, named after its port. "devs" also lists a
+# couple of serial ports that aren't Picos. The commands install.py
+# uses are supported, chained with "+" as with mpremote:
+#
+#   devs, connect <port>, fs cp <local> :<remote>, fs cat :<remote>, fs rm :<remote>, exec <code>
+#
+# Every session is appended to <port>.log, one line per invocation, so that the check can count
+# them.
+#
+# Usage: MPREMOTE="python fake_mpremote.py" python install.py --all
+import os
+import shutil
+import sys
+
+ROOT = os.environ.get("FAKE_MPREMOTE_DIR", "fake_devices")
+
+
+def list_devices():
+    return sorted(name for name in os.listdir(ROOT) if os.path.isdir(os.path.join(ROOT, name)))
+
+def device_path(device, remote):
+    if not remote.startswith(":"):
+        raise ValueError(f"Expected a remote path, got {remote}")
+    return os.path.join(ROOT, device, remote[1:])
+
+def run_command(device, command):
+    if command[:2] == ["fs", "cp"]:
+        shutil.copyfile(command[2], device_path(device, command[3]))
+    elif command[:2] == ["fs", "cat"]:
+        with open(device_path(device, command[2])) as file:
+            sys.stdout.write(file.read())
+    elif command[:2] == ["fs", "rm"]:
+        os.remove(device_path(device, command[2]))
+    elif command[0] == "exec":
+        cwd = os.getcwd()
+        os.chdir(os.path.join(ROOT, device))
+        try:
+            exec(command[1], {})
+        finally:
+            os.chdir(cwd)
+    else:
+        raise ValueError(f"Unsupported command {' '.join(command)}")
+
+def main():
+    args = sys.argv[1:]
+    if args == ["devs"]:
+        for device in list_devices():
+            print(f"{device} e660000000000000 2e8a:0005 MicroPython Board in FS mode")
+        # Other serial ports are listed too, and shouldn't be installed to
+        print("/dev/ttyS0 None 0000:0000 None None")
+        print("/dev/ttyUSB0 A50285BI 0403:6001 FTDI FT232R USB UART")
+        return
+
+    device = "auto"
+    if args[:1] == ["connect"]:
+        device = args[1]
+        args = args[2:]
+    if device == "auto":
+        devices = list_devices()
+        if not devices:
+            sys.exit("no device found")
+        device = devices[0]
+    if not os.path.isdir(os.path.join(ROOT, device)):
+        sys.exit(f"failed to access {device}")
+
+    with open(os.path.join(ROOT, device + ".log"), "a") as log:
+        log.write(" ".join(args).replace("\n", "\\n") + "\n")
+
+    commands = [[]]
+    for arg in args:
+        if arg == "+":
+            commands.append([])
+        else:
+            commands[-1].append(arg)
+
+    for command in commands:
+        try:
+            run_command(device, command)
+        except (OSError, ValueError) as ex:
+            sys.exit(f"{' '.join(command)}: {ex}")
+
+if __name__ == "__main__":
+    main()
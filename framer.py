@@ -0,0 +1,132 @@
+from debug import add_stat, inc_stat, register_stat, IS_MICROPYTHON
+import config
+import log
+
+STAT_CHECKSUM_ERRORS = register_stat("Checksum errors")
+STAT_DROPPED_BYTES = register_stat("Dropped bytes")
+
+# Longest possible XpressNet frame: header, 15 data bytes and checksum
+MAX_FRAME_LENGTH = 17
+
+# Dropped bytes are reported whenever framing recovers, or after this many if it never does
+DROP_REPORT_THRESHOLD = 256
+
+def frame_length(header):
+    # XpressNet headers encode the number of data bytes in their low nibble and are followed by a
+    # checksum
+    return (header & 0x0F) + 2
+
+def build_header_table(sequences):
+    # 256 entry table mapping each header byte to the length of its frame. Anything that isn't the
+    # start of a sequence we handle maps to 0. Single byte sequences are complete frames without a
+    # checksum.
+    table = bytearray(256)
+    for sequence in sequences:
+        header = sequence[0]
+        table[header] = 1 if len(sequence) == 1 else frame_length(header)
+    return table
+
+
+###################################################################################################
+# Framer
+# Assembles frames from a byte stream using the header table to learn each frame's length and
+# validating the XOR checksum as bytes arrive. After a checksum failure the header is dropped and
+# the rest of the frame is rescanned for the next plausible header.
+###################################################################################################
+
+class Framer:
+    def __init__(self, header_table):
+        self.header_table = header_table
+        self.ready = False
+        self.frame = None
+        self.dropped = 0
+        self._buffer = bytearray(MAX_FRAME_LENGTH)
+        self._view = memoryview(self._buffer)
+        self._length = 0
+        self._count = 0
+        self._checksum = 0
+        self._retry = bytearray()
+        self._retry_index = 0
+
+    def feed(self, data):
+        # Returns the number of bytes consumed from data, stopping as soon as a frame is complete.
+        # The frame is then available as a memoryview until the next call.
+        self.ready = False
+        i = 0
+        n = len(data)
+        while True:
+            # Bytes being rescanned after a checksum failure come before anything new
+            if self._retry_index < len(self._retry):
+                b = self._retry[self._retry_index]
+                self._retry_index += 1
+            elif i < n:
+                b = data[i]
+                i += 1
+            else:
+                return i
+
+            if self._push(b):
+                return i
+
+    def remaining(self):
+        # Number of bytes still needed to complete the frame in progress, or 0 between frames
+        if self._length == 0 or self._retry_index < len(self._retry):
+            return 0
+        return self._length - self._count
+
+    def _push(self, b):
+        length = self._length
+        if length == 0:
+            length = self.header_table[b]
+            if length == 0:
+                self._drop(1)
+                return False
+
+            self._length = length
+            self._count = 0
+            self._checksum = 0
+
+        self._buffer[self._count] = b
+        self._count += 1
+        self._checksum ^= b
+        if self._count < length:
+            return False
+
+        self._length = 0
+        if length != 1 and self._checksum != 0:
+            self._resync()
+            return False
+
+        if self.dropped:
+            self._report_dropped()
+
+        self.frame = self._view[:length]
+        self.ready = True
+        return True
+
+    def _drop(self, count):
+        self.dropped += count
+        if self.dropped >= DROP_REPORT_THRESHOLD:
+            self._report_dropped()
+
+    def _resync(self):
+        inc_stat(STAT_CHECKSUM_ERRORS)
+        self._drop(1)
+
+        # Everything after the header needs to be scanned again, ahead of anything already waiting
+        self._retry = self._buffer[1:self._count] + self._retry[self._retry_index:]
+        self._retry_index = 0
+
+    def _report_dropped(self):
+        log.warn("Dropped %d bytes", self.dropped)
+        add_stat(STAT_DROPPED_BYTES, self.dropped)
+        self.dropped = 0
+
+
+# Compiled variants, see native_micropy
+py_feed = Framer.feed
+py_push = Framer._push
+if IS_MICROPYTHON and config.NATIVE_CODE:
+    from native_micropy import framer_feed, framer_push
+    Framer.feed = framer_feed
+    Framer._push = framer_push
@@ -0,0 +1,73 @@
+from debug import STATS, add_stat, inc_stat, register_stat
+import com
+import config
+import gc
+import scheduler
+
+###################################################################################################
+# Idle time garbage collection
+# In low GC mode a scheduler job collects whenever nothing has been received since its last run, or
+# straight away if free memory runs low while the line stays busy, so that a collection rarely
+# pauses the middle of a frame. Once the line has gone quiet it's only collected again after more
+# traffic.
+#
+# MicroPython raises MemoryError instead of collecting when an allocation fails with automatic
+# collection turned off, so there it's left on as a backstop, with the threshold set to collect once
+# all but GC_MIN_FREE of the memory free at startup has been allocated. CPython frees nearly
+# everything by reference counting, so its cycle collector is simply turned off.
+###################################################################################################
+
+STAT_COLLECTIONS = register_stat("GC idle collections")
+STAT_FORCED = register_stat("GC forced collections")
+STAT_TIME = register_stat("GC time us")
+STAT_MAX = register_stat("GC max us")
+
+# Only MicroPython can report free memory
+_mem_free = getattr(gc, "mem_free", None)
+
+_job = None
+_threshold = -1
+_last_read = 0
+_collected_read = 0
+
+def start():
+    global _job, _threshold
+    if _mem_free:
+        gc.collect()
+        _threshold = gc.threshold()
+        gc.threshold(max(_mem_free() - config.GC_MIN_FREE, config.GC_MIN_FREE))
+    else:
+        gc.disable()
+    _job = scheduler.run_every(config.GC_IDLE_PERIOD / 1000, _check)
+
+def stop():
+    global _job
+    if _job:
+        _job.cancel()
+        _job = None
+    if _mem_free:
+        gc.threshold(_threshold)
+    else:
+        gc.enable()
+
+def _check():
+    global _last_read, _collected_read
+    read = STATS[com.STAT_READ]
+    idle = read == _last_read and com.available() == 0
+    _last_read = read
+
+    if idle and read != _collected_read:
+        _collected_read = read
+        collect(STAT_COLLECTIONS)
+    elif _mem_free and _mem_free() < config.GC_MIN_FREE:
+        collect(STAT_FORCED)
+
+def collect(stat):
+    start = scheduler.ticks_us()
+    gc.collect()
+    elapsed = scheduler.ticks_diff(scheduler.ticks_us(), start)
+
+    inc_stat(stat)
+    add_stat(STAT_TIME, elapsed)
+    if elapsed > STATS[STAT_MAX]:
+        STATS[STAT_MAX] = elapsed
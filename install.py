@@ -1,68 +1,274 @@
+import argparse
+import hashlib
+import json
 import os
+import shlex
+import shutil
+import subprocess
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
 from sys import stderr
 
 PICO_CONFIG_NAME = "pico_config.py"
 
 PICO_CONFIG = """MEM_LOG_SIZE = 500
+MEM_LOG_LEVEL = 1
+LCD_LOG_LEVEL = 1
+STDOUT_LOG_LEVEL = 1
 LCD_LOGGER = None
+LCD_LOG_WRAP = False
+LCD_MAX_FPS = 10
+LOG_THREAD = False
+LOG_QUEUE_SIZE = 32
+# Sends log lines to a UART ("uart:<id>"), file descriptor ("fd:<n>") or path instead of stdout
+LOG_TRANSPORT = None
+LOG_TRANSPORT_LEVEL = 1
+LOG_TRANSPORT_BAUD = 115200
+LOG_TRANSPORT_QUEUE = 2048
 STDOUT_LOGGER = False
 LOG_PING = False
 LED_PIN = 25
 LED_INITIAL_VALUE = 0
 SCHEDULER_PERIOD = 1000
+SCHEDULER_WHEEL_SLOTS = 0
+SCHEDULER_WHEEL_RESOLUTION = 10
+ASYNC_ENGINE = False
+TCP_HOST = "127.0.0.1"
+TCP_PORT = 0
+HANDLER_PROFILING = False
+NATIVE_CODE = True
+LOW_GC = False
+GC_IDLE_PERIOD = 50
+GC_MIN_FREE = 8192
+CAPTURE_SIZE = 0
+CAPTURE_PATH = "capture.bin"
 DEVICE_VERSION = 107
 DEBUG_LOCO = 9999
+LOCO_TABLE_SIZE = 16384
+CV_STORE_PATH = "cvs"
+CV_FLUSH_DELAY = 5
+CV_FLUSH_BATCH = 4
 """
 
 FILES = [
     "alink.py",
+    "alink_async.py",
+    "capture.py",
     "main.py",
     "com.py",
+    "cvs.py",
     (PICO_CONFIG_NAME, "config.py"),
     "debug.py",
+    "debugmenu.py",
     "eventcom_micropy.py",
+    "framer.py",
+    "idlegc.py",
     "lcd_rp2040lcd096.py",
     "lcdlog.py",
+    "locos.py",
     "log.py",
+    "logthread.py",
+    "logtransport.py",
     "memlog.py",
-    "scheduler.py"
+    "native_micropy.py",
+    "parseexception.py",
+    "profiler.py",
+    "scheduler.py",
+    "stats.py"
 ]
 
-def copy_to_pico(source, dest=None):
-    dest = dest or source
-    exit_code = os.system(f"mpremote fs cp ./{source} :{dest}")
+# Files that are always copied as source with --mpy. main.py has to be source to be run at boot, and
+# the config is kept editable on the device.
+SOURCE_ONLY = ("main.py", PICO_CONFIG_NAME)
+
+# Hashes of the files last installed, kept on the device so that only changed files are copied
+MANIFEST_NAME = ".alink_manifest"
+
+# Removes files from the device, ignoring any that aren't there
+REMOVE_SCRIPT = """import os
+for name in {!r}:
+    try:
+        os.remove(name)
+    except OSError:
+        pass
+"""
+
+# USB vendor id of the RP2040's MicroPython port, used to pick out Picos from other serial ports
+PICO_USB_VENDOR = "2e8a"
+
+# The mpremote command, which can be overridden with MPREMOTE, e.g. to use fake_mpremote.py
+MPREMOTE = shlex.split(os.environ.get("MPREMOTE", "mpremote"))
+
+# Where the .mpy files are built
+BUILD_DIR = "build"
+
+# The RP2040's Cortex-M0+, needed for the @micropython.native and viper code
+MPY_ARCH = "armv6m"
+
+def compile_mpy(source, optimize):
+    os.makedirs(BUILD_DIR, exist_ok=True)
+    target = os.path.join(BUILD_DIR, source[:-3] + ".mpy")
+    options = f"-march={MPY_ARCH}" + (" -O1" if optimize else "")
+    exit_code = os.system(f"mpy-cross {options} -o {target} {source}")
     if exit_code != 0:
-        stderr.write(f"mpremote exited with exit code {exit_code}\n")
+        stderr.write(f"mpy-cross exited with exit code {exit_code}\n")
         exit(exit_code)
+    return target
 
-def is_mpremote_installed():
+def config_names(text):
+    return {line.split("=")[0].strip() for line in text.splitlines() if "=" in line and not line.startswith("#")}
+
+def add_missing_config():
+    # Options added since pico_config.py was generated get their defaults, as everything reads them
+    # straight from config and the device would fail at boot without them
+    with open(PICO_CONFIG_NAME) as config:
+        existing = config.read()
+
+    defined = config_names(existing)
+    missing = [line for line in PICO_CONFIG.splitlines() if config_names(line) - defined]
+    if not missing:
+        return
+
+    print(f"Adding missing options to {PICO_CONFIG_NAME}: {', '.join(line.split('=')[0].strip() for line in missing)}")
+    with open(PICO_CONFIG_NAME, "a") as config:
+        if existing and not existing.endswith("\n"):
+            config.write("\n")
+        config.write("\n".join(missing) + "\n")
+
+def file_hash(path):
+    with open(path, "rb") as file:
+        return hashlib.sha256(file.read()).hexdigest()[:16]
+
+def build_file_list(use_mpy, optimize):
+    # Returns (local path, device path) pairs for everything that should be on the device
+    files = []
+    for file in FILES:
+        if isinstance(file, str):
+            file = (file,)
+
+        if use_mpy and file[0] not in SOURCE_ONLY:
+            source = file[0]
+            files.append((compile_mpy(source, optimize), source[:-3] + ".mpy"))
+        else:
+            files.append((file[0], file[-1]))
+    return files
+
+def run_mpremote(device, args):
+    command = MPREMOTE + ["connect", device] + args
+    return subprocess.run(command, capture_output=True, text=True)
+
+def list_devices():
+    result = subprocess.run(MPREMOTE + ["devs"], capture_output=True, text=True)
+    if result.returncode != 0:
+        return []
+    # Each line starts with the port, followed by the serial number and USB vendor:product ids.
+    # Every serial port on the host is listed, so only those with the Raspberry Pi vendor id used by
+    # RP2040 MicroPython boards are kept.
+    devices = []
+    for line in result.stdout.splitlines():
+        fields = line.split()
+        if len(fields) > 2 and fields[2].lower().startswith(PICO_USB_VENDOR + ":"):
+            devices.append(fields[0])
+    return devices
+
+def read_manifest(device):
+    # A missing or unreadable manifest means nothing on the device is known to be current
+    result = run_mpremote(device, ["fs", "cat", ":" + MANIFEST_NAME])
+    if result.returncode != 0:
+        return {}
+    try:
+        return json.loads(result.stdout)
+    except ValueError:
+        return {}
+
+def deploy(device, files, use_mpy, force=False):
+    # Returns a one line summary, or raises RuntimeError if mpremote failed
+    manifest = {} if force else read_manifest(device)
+    wanted = {dest: file_hash(source) for source, dest in files}
+    copies = [(source, dest) for source, dest in files if manifest.get(dest) != wanted[dest]]
+
+    # Anything an earlier install left that's no longer deployed is removed. MicroPython imports a
+    # .py in preference to a .mpy, so the source is removed along with each .mpy copied, whether
+    # or not the manifest knows about it.
+    removals = {dest for dest in manifest if dest not in wanted}
+    if use_mpy:
+        removals.update(dest[:-4] + ".py" for _, dest in copies if dest.endswith(".mpy"))
+
+    if not copies and not removals:
+        return "up to date"
+
+    # Everything is done in a single session, with the commands chained by "+". The manifest goes
+    # last, so an interrupted install is picked up again by the next one.
+    args = []
+    for source, dest in copies:
+        args += ["fs", "cp", source, ":" + dest, "+"]
+    if removals:
+        args += ["exec", REMOVE_SCRIPT.format(sorted(removals)), "+"]
+
+    with tempfile.NamedTemporaryFile("w", suffix=".json", delete=False) as manifest_file:
+        json.dump(wanted, manifest_file)
     try:
-        import mpremote
-        return True
-    except ModuleNotFoundError:
-        return False
+        result = run_mpremote(device, args + ["fs", "cp", manifest_file.name, ":" + MANIFEST_NAME])
+    finally:
+        os.remove(manifest_file.name)
+
+    if result.returncode != 0:
+        raise RuntimeError(f"mpremote exited with exit code {result.returncode}\n{result.stderr}")
+    return f"copied {len(copies)} of {len(files)} files, removed {len(removals)}"
+
+def is_mpremote_installed():
+    return shutil.which(MPREMOTE[0]) is not None
 
 def main():
-    print("Installing pico-alink to attached device...")
+    parser = argparse.ArgumentParser(description="Installs pico-alink to attached devices")
+    parser.add_argument("--mpy", action="store_true", help="deploy precompiled .mpy files")
+    parser.add_argument("-O", dest="optimize", action="store_true", help="strip debug logging and asserts from .mpy files")
+    parser.add_argument("--device", action="append", help="port of a device to install to, can be repeated")
+    parser.add_argument("--all", action="store_true", help="install to every attached device")
+    parser.add_argument("--force", action="store_true", help="copy every file, ignoring the manifests")
+    args = parser.parse_args()
 
     if not is_mpremote_installed():
         stderr.write("    *** mpremote is not installed ***")
         exit(1)
 
+    if args.mpy and not shutil.which("mpy-cross"):
+        stderr.write("    *** mpy-cross is not installed ***")
+        exit(1)
+
+    devices = args.device or ["auto"]
+    if args.all:
+        devices = list_devices()
+        if not devices:
+            stderr.write("    *** No devices found ***")
+            exit(1)
+    print(f"Installing pico-alink to {', '.join(devices)}...")
+
     if os.path.exists(PICO_CONFIG_NAME):
         print(f"Existing {PICO_CONFIG_NAME} found")
+        add_missing_config()
     else:
         print(f"Generating default {PICO_CONFIG_NAME}...")
         with open(PICO_CONFIG_NAME, "w") as config:
             config.write(PICO_CONFIG)
 
-    print("Copying files to device...")
-    for file in FILES:
-        if isinstance(file, str):
-            file = (file,)
-        copy_to_pico(*file)
+    # Files are compiled once and shared by every device
+    files = build_file_list(args.mpy, args.optimize)
 
+    print("Copying changed files...")
+    failed = False
+    with ThreadPoolExecutor(max_workers=len(devices)) as executor:
+        results = {device: executor.submit(deploy, device, files, args.mpy, args.force) for device in devices}
+        for device, result in results.items():
+            try:
+                print(f"    {device}: {result.result()}")
+            except RuntimeError as ex:
+                stderr.write(f"    {device}: {ex}\n")
+                failed = True
+
+    if failed:
+        exit(1)
     print("Installation successful!")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
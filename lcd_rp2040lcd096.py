@@ -192,3 +192,12 @@ class Screen(framebuf.FrameBuffer):
         self.cs(0)
         self.spi.write(self.buffer)
         self.cs(1)
+
+    def display_rows(self, top, bottom):
+        # Only push the rows from top to bottom inclusive
+        row_bytes = self.width * 2
+        self.SetWindows(0, top, self.width-1, bottom)
+        self.dc(1)
+        self.cs(0)
+        self.spi.write(memoryview(self.buffer)[top * row_bytes:(bottom + 1) * row_bytes])
+        self.cs(1)
@@ -1,18 +1,94 @@
+from stats import STATS, inc_stat, register_stat
+import config
+import memlog
+import scheduler
+
+_device = None
 _screen = None
-_buffer = []
+
+# Number of lines currently on screen, and the slot the next line goes in when wrapping
+_lines = 0
+_next = 0
+
+# Bitmask of the lines that have changed since the screen was last pushed to the device
+_dirty = 0
+
+# When LCD_MAX_FPS is set, the screen is pushed by a scheduled job at most that many times a second
+# so that a burst of log lines becomes a single frame
+_frame_job = None
+_last_frame = 0
+
+# Opening the screen takes the best part of a second, so unless the log thread can do it on the
+# other core it's put off until the first reply has gone out and the line is quiet, or until
+# _OPEN_TIMEOUT ms after startup if nothing ever talks to us. Lines logged before then are replayed
+# from the memory log.
+_OPEN_CHECK_PERIOD = 0.1
+_OPEN_TIMEOUT = 5000
+_open_job = None
+_init_time = 0
+_last_read = 0
+
+# Number of frames pushed to the device, and log lines that were merged into an already pending frame
+STAT_FRAMES = register_stat("LCD frames")
+STAT_COALESCED = register_stat("LCD lines coalesced")
 
 def init(device):
-    global _screen, DEVICE, INFO, ERROR, WARN, BLACK
-    DEVICE = device
-    INFO = DEVICE.rgb(192, 192, 192)
-    ERROR = DEVICE.rgb(192, 0, 0)
-    WARN = DEVICE.rgb(192, 128, 0)
+    # The device can be given as the driver module or its name, in which case it isn't imported
+    # until the screen is opened
+    global _device, _screen, _lines, _next, _dirty, _frame_job, _last_frame
+    global _open_job, _init_time, _last_read
+    _device = device
+    _screen = None
+    _lines = 0
+    _next = 0
+    _dirty = 0
+    _frame_job = None
+    _last_frame = 0
+    STATS[STAT_FRAMES] = 0
+    STATS[STAT_COALESCED] = 0
+    _init_time = scheduler.now()
+    _last_read = 0
+    _open_job = None
+    if not config.LOG_THREAD:
+        _open_job = scheduler.run_every(_OPEN_CHECK_PERIOD, _check_open)
+
+def _check_open():
+    # Imported here as com logs through us while it's being imported
+    global _last_read
+    from debug import STATS
+    import com
+    read = STATS[com.STAT_READ]
+    quiet = read == _last_read and com.available() == 0
+    _last_read = read
+
+    if (STATS[com.STAT_WRITTEN] and quiet) or scheduler.now() - _init_time >= _OPEN_TIMEOUT:
+        _open()
+        for level, text in memlog.records():
+            if level >= config.LCD_LOG_LEVEL:
+                # Log levels map onto the colour indexes, with debug shown as info
+                _append(text, max(level - 1, INFO))
+
+def _open():
+    global _screen, _colours, DEVICE, BLACK, _open_job
+    if _open_job:
+        _open_job.cancel()
+        _open_job = None
+    DEVICE = __import__(_device) if isinstance(_device, str) else _device
+    _colours = (DEVICE.rgb(192, 192, 192), DEVICE.rgb(192, 128, 0), DEVICE.rgb(192, 0, 0))
     BLACK = DEVICE.rgb(0, 0, 0)
 
-    _screen = device.Screen()
+    _screen = DEVICE.Screen()
     _screen.fill(BLACK)
     _screen.display()
 
+# Colour indexes for each log level, the colours themselves are set once the device is opened
+INFO = 0
+WARN = 1
+ERROR = 2
+
+def debug(text):
+    _append(text, INFO)
+
 def info(text):
     _append(text, INFO)
 
@@ -22,10 +98,17 @@ def warn(text):
 def error(text):
     _append(text, ERROR)
 
-def _append(text, colour):
-    global _buffer
+def _append(text, level):
     if _screen is None:
-        return
+        # Only the log thread opens the screen itself, otherwise the line is replayed from the
+        # memory log once the screen has been opened
+        if _device is None or not config.LOG_THREAD:
+            return
+        _open()
+    colour = _colours[level]
+
+    if config.LOG_THREAD and _dirty:
+        inc_stat(STAT_COALESCED)
 
     if not isinstance(text, str):
         text = str(text)
@@ -34,23 +117,91 @@ def _append(text, colour):
         overflow = text[DEVICE.WIDTH:]
         text = text[:DEVICE.WIDTH]
 
-        if (len(_buffer) == DEVICE.HEIGHT):
-            _buffer = _buffer[1:]
-            
-        _buffer.append((colour, text))
+        if config.LCD_LOG_WRAP:
+            _wrap_line(text, colour)
+        else:
+            _scroll_line(text, colour)
 
         if not overflow:
             break
         text = overflow
 
-    _render()
-    
-def _render():
-    y = DEVICE.LINE_OFFSET_Y
+    # The log thread flushes once it has written everything waiting
+    if config.LOG_THREAD:
+        return
 
-    _screen.fill(BLACK)
-    for line in _buffer:
-        _screen.text(line[1], 0, y, line[0])
-        y += DEVICE.LINE_HEIGHT
-        
-    _screen.display()
+    if config.LCD_MAX_FPS:
+        _request_frame()
+    else:
+        _flush()
+
+def _request_frame():
+    global _frame_job
+    if _frame_job:
+        inc_stat(STAT_COALESCED)
+        return
+
+    at = max(scheduler.now(), _last_frame + 1000 // config.LCD_MAX_FPS)
+    _frame_job = scheduler.run_at(at, _render_frame)
+
+def _render_frame():
+    global _frame_job, _last_frame
+    _frame_job = None
+    _last_frame = scheduler.now()
+    _flush()
+
+def flush():
+    _flush()
+
+def _clear_line(line):
+    height = DEVICE.LINE_HEIGHT
+    _screen.fill_rect(0, line * height, _screen.width, height, BLACK)
+
+def _draw_line(line, text, colour):
+    global _dirty
+    _screen.text(text, 0, line * DEVICE.LINE_HEIGHT + DEVICE.LINE_OFFSET_Y, colour)
+    _dirty |= 1 << line
+
+def _scroll_line(text, colour):
+    global _lines, _dirty
+    if _lines == DEVICE.HEIGHT:
+        # The screen is full, so scroll everything up a line rather than redrawing it. Every line
+        # has moved, so they all need pushing to the device.
+        _screen.scroll(0, -DEVICE.LINE_HEIGHT)
+        _clear_line(_lines - 1)
+        _dirty = (1 << _lines) - 1
+        _draw_line(_lines - 1, text, colour)
+    else:
+        # Lines are added below the previous ones until the screen fills up
+        _draw_line(_lines, text, colour)
+        _lines += 1
+
+def _wrap_line(text, colour):
+    # New lines overwrite the oldest one, followed by a blank line to mark where the log wraps. Only
+    # those two lines ever need pushing to the device.
+    global _next, _dirty
+    _clear_line(_next)
+    _draw_line(_next, text, colour)
+
+    _next = (_next + 1) % DEVICE.HEIGHT
+    _clear_line(_next)
+    _dirty |= 1 << _next
+
+def _flush():
+    # Push each run of consecutive dirty lines in a single window
+    global _dirty
+    if _dirty:
+        inc_stat(STAT_FRAMES)
+
+    height = DEVICE.LINE_HEIGHT
+    line = 0
+    while _dirty:
+        if _dirty & 1:
+            start = line
+            while _dirty & 1:
+                _dirty >>= 1
+                line += 1
+            _screen.display_rows(start * height, line * height - 1)
+        else:
+            _dirty >>= 1
+            line += 1
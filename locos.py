@@ -0,0 +1,53 @@
+from config import LOCO_TABLE_SIZE
+
+# State for every loco address is packed into a single preallocated table with a fixed size record
+# per loco, so looking a loco up is just an index calculation:
+#   0: Speed byte as sent by the throttle, direction in bit 7 and speed in bits 0-6
+#   1: Function group 1, F0 in bit 4 and F4-F1 in bits 3-0
+#   2: Function groups 2 and 3, F12-F5
+#   3: Function group 4, F20-F13
+#   4: Function group 5, F28-F21
+RECORD_SIZE = 5
+
+SPEED = 0
+FUNCTIONS_F0_F4 = 1
+FUNCTIONS_F5_F12 = 2
+FUNCTIONS_F13_F20 = 3
+FUNCTIONS_F21_F28 = 4
+
+# Where each function bank is stored
+#   key: Bank number
+#   values: (record offset, shift, mask)
+BANKS = {
+    0x20: (FUNCTIONS_F0_F4, 0, 0x1F),
+    0x21: (FUNCTIONS_F5_F12, 0, 0x0F),
+    0x22: (FUNCTIONS_F5_F12, 4, 0x0F),
+    0x23: (FUNCTIONS_F13_F20, 0, 0xFF),
+    0x28: (FUNCTIONS_F21_F28, 0, 0xFF)
+}
+
+_table = bytearray(LOCO_TABLE_SIZE * RECORD_SIZE)
+
+def get(loco, offset):
+    if loco >= LOCO_TABLE_SIZE:
+        return 0
+    return _table[loco * RECORD_SIZE + offset]
+
+def set_speed(loco, speed):
+    if loco < LOCO_TABLE_SIZE:
+        _table[loco * RECORD_SIZE + SPEED] = speed
+
+def set_functions(loco, bank, state):
+    # Returns the bits of the bank that differ from the stored state, so that only functions that
+    # have changed need to be acted on. Locos outside the table have nothing stored to compare
+    # with, so every function counts as changed.
+    offset, shift, mask = BANKS[bank]
+    if loco >= LOCO_TABLE_SIZE:
+        return mask
+
+    i = loco * RECORD_SIZE + offset
+    stored = _table[i]
+    changed = ((stored >> shift) ^ state) & mask
+    if changed:
+        _table[i] = (stored & ~(mask << shift)) | ((state & mask) << shift)
+    return changed
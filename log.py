@@ -1,17 +1,57 @@
 import config
 import memlog
 
-_loggers = [
-    memlog
-]
+# Log levels, also used as indexes into each sink's tuple of methods
+DEBUG = 0
+INFO = 1
+WARN = 2
+ERROR = 3
+
+LEVEL_NAMES = ("DEBUG", "INFO", "WARN", "ERROR")
+
+# Registered sinks as (threshold, (debug, info, warn, error)) pairs. The methods are looked up once
+# up front so that nothing needs resolving when a message is logged.
+_sinks = []
+
+# Lowest threshold of any sink, anything below this is discarded without being formatted
+_min_level = ERROR + 1
+
+def add_sink(logger, threshold):
+    global _min_level
+    methods = (logger.debug, logger.info, logger.warn, logger.error)
+    _sinks.append((threshold, methods))
+    _min_level = min(_min_level, threshold)
+
+def enabled(level):
+    # Allows callers to skip building up expensive messages that nobody is going to see
+    return level >= _min_level
+
+
+add_sink(memlog, config.MEM_LOG_LEVEL)
+
+# With LOG_THREAD set the other sinks are run on a second thread, fed through logthread. The memory
+# log stays put as it's cheap and the debug menu reads it.
+if config.LOG_THREAD:
+    import logthread
+    _add_slow_sink = logthread.add_sink
+else:
+    _add_slow_sink = add_sink
 
 if config.LCD_LOGGER:
     import lcdlog
     lcdlog.init(config.LCD_LOGGER)
-    _loggers.append(lcdlog)
+    _add_slow_sink(lcdlog, config.LCD_LOG_LEVEL)
+
+if config.LOG_TRANSPORT:
+    # Queueing is cheap, so this stays on the protocol thread even with LOG_THREAD set
+    import logtransport
+    logtransport.start(config.LOG_TRANSPORT)
+    add_sink(logtransport, config.LOG_TRANSPORT_LEVEL)
 
-if config.STDOUT_LOGGER:
+elif config.STDOUT_LOGGER:
     class StdoutLogger:
+        def debug(self, text):
+            print(f"DEBUG: {text}")
         def info(self, text):
             print(f"INFO: {text}")
         def warn(self, text):
@@ -19,21 +59,43 @@ if config.STDOUT_LOGGER:
         def error(self, text):
             print(f"ERROR: {text}")
 
-    _loggers.append(StdoutLogger())
+    _add_slow_sink(StdoutLogger(), config.STDOUT_LOG_LEVEL)
+
+if config.LOG_THREAD and logthread._sinks:
+    add_sink(logthread, min(threshold for threshold, _, _ in logthread._sinks))
+    logthread.start()
+    try:
+        import atexit
+        atexit.register(logthread.stop)
+    except ImportError:
+        pass
+
+
+# Messages are %-style format strings and are only formatted if at least one sink wants them.
+#
+# Debug logging on the hot path should also be wrapped in "if __debug__:" so that it is removed
+# completely when compiled with optimisations enabled (mpy-cross -O1 or micropython.opt_level(1)).
+def debug(message, *args):
+    _apply(DEBUG, message, args)
 
+def info(message, *args):
+    _apply(INFO, message, args)
 
-def info(text):
-    _apply("info", text)
+def warn(message, *args):
+    _apply(WARN, message, args)
 
-def warn(text):
-    _apply("warn", text)
+def error(message, *args):
+    _apply(ERROR, message, args)
 
-def error(text):
-    _apply("error", text)
+def _apply(level, message, args):
+    if level < _min_level:
+        return
 
-def _apply(method, text):
-    if not isinstance(text, str):
-        text = str(text)
+    if args:
+        message = message % args
+    elif not isinstance(message, str):
+        message = str(message)
 
-    for logger in _loggers:
-        getattr(logger, method)(text)
\ No newline at end of file
+    for threshold, methods in _sinks:
+        if level >= threshold:
+            methods[level](message)
\ No newline at end of file
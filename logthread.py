@@ -0,0 +1,139 @@
+# pyright: reportMissingImports=false
+from stats import inc_stat, register_stat
+import _thread
+import config
+import time
+
+###################################################################################################
+# Log thread
+# Sinks registered here are run on a second thread, on the Pico's second core, so that slow ones
+# like the LCD never hold up the protocol loop. Records cross over in a bounded ring. When it's full
+# the oldest record is dropped, so logging never waits for the sinks to catch up.
+###################################################################################################
+
+DEBUG = 0
+INFO = 1
+WARN = 2
+ERROR = 3
+
+_size = config.LOG_QUEUE_SIZE
+_levels = bytearray(_size)
+_texts = [None] * _size
+_head = 0
+_count = 0
+
+# Held only while the ring indexes are updated
+_lock = _thread.allocate_lock()
+
+# Released by the logging side to wake the thread when it's waiting for records
+_wake = _thread.allocate_lock()
+
+# Held by the thread while it's running
+_done = _thread.allocate_lock()
+_running = False
+
+# Sinks as (threshold, (debug, info, warn, error)) pairs, as in log
+_sinks = []
+
+# Records dropped because the ring was full
+STAT_DROPPED = register_stat("Log lines dropped")
+
+
+def add_sink(logger, threshold):
+    methods = (logger.debug, logger.info, logger.warn, logger.error)
+    _sinks.append((threshold, methods, getattr(logger, "flush", None)))
+
+def start():
+    global _running
+    _running = True
+    _wake.acquire()
+    _thread.start_new_thread(_main, ())
+
+def stop():
+    # Waits for everything already queued to be written
+    global _running
+    if not _running:
+        return
+    _running = False
+    _signal()
+    _done.acquire()
+    _done.release()
+
+def debug(text):
+    _push(DEBUG, text)
+
+def info(text):
+    _push(INFO, text)
+
+def warn(text):
+    _push(WARN, text)
+
+def error(text):
+    _push(ERROR, text)
+
+def _signal():
+    if _wake.locked():
+        try:
+            _wake.release()
+        except RuntimeError:
+            pass
+
+def _push(level, text):
+    global _head, _count
+    with _lock:
+        if _count == _size:
+            _texts[_head] = None
+            _head = (_head + 1) % _size
+            _count -= 1
+            inc_stat(STAT_DROPPED)
+        p = (_head + _count) % _size
+        _levels[p] = level
+        _texts[p] = text
+        _count += 1
+    _signal()
+
+def _pop():
+    global _head, _count
+    with _lock:
+        if _count == 0:
+            return None, None
+        level = _levels[_head]
+        text = _texts[_head]
+        _texts[_head] = None
+        _head = (_head + 1) % _size
+        _count -= 1
+    return level, text
+
+def _write(level, text):
+    for threshold, methods, _ in _sinks:
+        if level >= threshold:
+            methods[level](text)
+
+def _main():
+    with _done:
+        frame_time = 1 / config.LCD_MAX_FPS if config.LCD_LOGGER and config.LCD_MAX_FPS else 0
+        while True:
+            # Everything waiting is written before the sinks flush, so a burst of records becomes
+            # a single frame on the LCD
+            level, text = _pop()
+            if text is None:
+                if not _running:
+                    return
+                _wake.acquire()
+                continue
+
+            while text is not None:
+                try:
+                    _write(level, text)
+                except Exception:
+                    # There's nowhere left to report a failing sink to
+                    pass
+                level, text = _pop()
+
+            for _, _, flush in _sinks:
+                if flush:
+                    flush()
+
+            # Give more records a chance to arrive before the next frame
+            if frame_time:
+                time.sleep(frame_time)
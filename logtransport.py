@@ -0,0 +1,134 @@
+# pyright: reportMissingImports=false
+from log import DEBUG, INFO, WARN, ERROR, LEVEL_NAMES
+from stats import inc_stat, register_stat
+import config
+import scheduler
+
+###################################################################################################
+# Log transport
+# Sends log lines somewhere other than stdout, so that they never hold up protocol replies. Lines
+# are queued in a bounded ring and written out without blocking, whatever the transport can take
+# straight away, with the rest sent by a scheduled job. Lines that don't fit in the ring are dropped.
+#
+# LOG_TRANSPORT selects where they go:
+#   "uart:<id>"  a UART on the Pico, at LOG_TRANSPORT_BAUD
+#   "fd:<n>"     an already open file descriptor on desktop, e.g. python alink.py 3>alink.log
+#   anything else is a path on desktop, such as a file or a named pipe
+#
+# If the transport fails, e.g. the reader at the other end of a pipe exits, it's switched off and
+# every line after that is counted as dropped, so logging never raises into the protocol.
+###################################################################################################
+
+# Most bytes handed to a UART at once, so that a write never takes long
+_UART_CHUNK = 32
+
+# How long to wait before retrying when the transport can't take any more
+_RETRY_SECONDS = 0.01
+
+_size = config.LOG_TRANSPORT_QUEUE
+_buffer = bytearray(_size)
+_view = memoryview(_buffer)
+_start = 0
+_used = 0
+_write = None
+_job = None
+
+# Lines dropped because the queue was full or the transport has failed
+STAT_DROPPED = register_stat("Log transport lines dropped")
+
+
+def _open_uart(uart_id):
+    from machine import UART
+    uart = UART(uart_id, config.LOG_TRANSPORT_BAUD)
+
+    def write(data):
+        try:
+            return uart.write(data[:_UART_CHUNK]) or 0
+        except OSError:
+            _close()
+            return 0
+    return write
+
+def _open_fd(fd):
+    import os
+    os.set_blocking(fd, False)
+
+    def write(data):
+        try:
+            return os.write(fd, data)
+        except BlockingIOError:
+            return 0
+        except OSError:
+            _close()
+            return 0
+    return write
+
+def start(spec):
+    global _write
+    if spec.startswith("uart:"):
+        _write = _open_uart(int(spec[5:]))
+    elif spec.startswith("fd:"):
+        _write = _open_fd(int(spec[3:]))
+    else:
+        import os
+        _write = _open_fd(os.open(spec, os.O_WRONLY | os.O_CREAT | os.O_APPEND | os.O_NONBLOCK))
+
+def _close():
+    # Gives up on a transport that has failed, dropping whatever is still queued
+    global _write, _used, _job
+    _write = None
+    _used = 0
+    if _job:
+        _job.cancel()
+        _job = None
+
+def debug(text):
+    _append(DEBUG, text)
+
+def info(text):
+    _append(INFO, text)
+
+def warn(text):
+    _append(WARN, text)
+
+def error(text):
+    _append(ERROR, text)
+
+def _append(level, text):
+    global _used
+    if not _write:
+        inc_stat(STAT_DROPPED)
+        return
+
+    line = f"{LEVEL_NAMES[level]}: {text}\n".encode()
+    length = len(line)
+    if length > _size - _used:
+        inc_stat(STAT_DROPPED)
+        return
+
+    end = (_start + _used) % _size
+    first = min(length, _size - end)
+    _view[end:end + first] = line[:first]
+    if first < length:
+        _view[:length - first] = line[first:]
+    _used += length
+
+    _send()
+
+def _retry():
+    global _job
+    _job = None
+    _send()
+
+def _send():
+    global _start, _used, _job
+    while _used:
+        end = min(_start + _used, _size)
+        count = _write(_view[_start:end])
+        if not count:
+            break
+        _start = (_start + count) % _size
+        _used -= count
+
+    if _used and not _job:
+        _job = scheduler.run_in(_RETRY_SECONDS, _retry)
@@ -1,2 +1,10 @@
-import alink
+import config
+
+if config.TCP_PORT:
+    import alink_tcp as alink
+elif config.ASYNC_ENGINE:
+    import alink_async as alink
+else:
+    import alink
+
 alink.main()
\ No newline at end of file
@@ -1,11 +1,23 @@
 from config import MEM_LOG_SIZE
 
-INFO = "INFO"
-WARN = "WARN"
-ERROR = "ERROR"
+DEBUG = 0
+INFO = 1
+WARN = 2
+ERROR = 3
 
-_buffer = []
-_size = 0
+LEVEL_NAMES = ("DEBUG", "INFO", "WARN", "ERROR")
+
+# Records are stored back to back in a preallocated ring as a level byte, a length byte and then the
+# text itself, one ASCII byte per character. The oldest records are dropped to make space for new ones.
+_RECORD_HEADER = 2
+_MAX_TEXT = min(255, MEM_LOG_SIZE - _RECORD_HEADER)
+
+_buffer = bytearray(MEM_LOG_SIZE)
+_start = 0
+_used = 0
+
+def debug(text):
+    _append(DEBUG, text)
 
 def info(text):
     _append(INFO, text)
@@ -16,15 +28,54 @@ def warn(text):
 def error(text):
     _append(ERROR, text)
 
+def _drop_oldest():
+    global _start, _used
+    size = _RECORD_HEADER + _buffer[(_start + 1) % MEM_LOG_SIZE]
+    _start = (_start + size) % MEM_LOG_SIZE
+    _used -= size
+
 def _append(level, text):
-    global _size
-    while len(text) + _size > MEM_LOG_SIZE:
-        old = _buffer.pop(0)
-        _size -= len(old[1])
+    global _used
+    length = min(len(text), _MAX_TEXT)
+    while MEM_LOG_SIZE - _used < _RECORD_HEADER + length:
+        _drop_oldest()
+
+    p = (_start + _used) % MEM_LOG_SIZE
+    _buffer[p] = level
+    p += 1
+    if p == MEM_LOG_SIZE:
+        p = 0
+    _buffer[p] = length
+
+    for i in range(length):
+        p += 1
+        if p == MEM_LOG_SIZE:
+            p = 0
+        c = ord(text[i])
+        _buffer[p] = c if c < 128 else 63
+
+    _used += _RECORD_HEADER + length
+
+def records():
+    # Lazily decodes each record in turn, oldest first
+    p = _start
+    remaining = _used
+    while remaining:
+        level = _buffer[p]
+        length = _buffer[(p + 1) % MEM_LOG_SIZE]
+        p = (p + _RECORD_HEADER) % MEM_LOG_SIZE
+
+        end = p + length
+        if end <= MEM_LOG_SIZE:
+            text = bytes(_buffer[p:end])
+        else:
+            end -= MEM_LOG_SIZE
+            text = bytes(_buffer[p:]) + bytes(_buffer[:end])
 
-    _buffer.append((level, text))
-    _size += len(text)
+        yield level, text.decode()
+        p = end % MEM_LOG_SIZE
+        remaining -= _RECORD_HEADER + length
 
 def output(out):
-    for level, text in _buffer:
-        out(f"{level}: {text}")
\ No newline at end of file
+    for level, text in records():
+        out(f"{LEVEL_NAMES[level]}: {text}")
\ No newline at end of file
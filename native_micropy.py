@@ -0,0 +1,90 @@
+# pyright: reportMissingImports=false, reportUndefinedVariable=false
+import micropython
+
+###################################################################################################
+# Compiled variants of the hot routines, swapped in at import on MicroPython when NATIVE_CODE is
+# set. Each module that swaps one in keeps the pure Python version it replaces under a py_ name, so
+# that the two can be compared. They must behave exactly the same, check_native.py compares them on
+# the device.
+###################################################################################################
+
+@micropython.native
+def calc_checksum(data):
+    # Replies are built from tuples as well as buffers, so this can't use a viper pointer
+    checkSum = 0
+    for v in data:
+        checkSum ^= v
+    return checkSum & 0xFF
+
+@micropython.viper
+def decode_loco_id(buffer) -> int:
+    p = ptr8(buffer)
+    high = p[0]
+    if (high & 0xC0) == 0xC0:
+        return ((high & 0x3F) << 8) | p[1]
+
+    return p[1]
+
+@micropython.native
+def for_each_function(functions, changed, state, action):
+    bit = 1
+    for f in functions:
+        if bit > changed:
+            break
+        if changed & bit:
+            action(f, state & bit != 0)
+        bit <<= 1
+
+
+###################################################################################################
+# Framer
+###################################################################################################
+
+@micropython.native
+def framer_feed(self, data):
+    self.ready = False
+    i = 0
+    n = len(data)
+    while True:
+        if self._retry_index < len(self._retry):
+            b = self._retry[self._retry_index]
+            self._retry_index += 1
+        elif i < n:
+            b = data[i]
+            i += 1
+        else:
+            return i
+
+        if self._push(b):
+            return i
+
+@micropython.native
+def framer_push(self, b):
+    length = self._length
+    if length == 0:
+        length = self.header_table[b]
+        if length == 0:
+            self._drop(1)
+            return False
+
+        self._length = length
+        self._count = 0
+        self._checksum = 0
+
+    self._buffer[self._count] = b
+    self._count += 1
+    self._checksum ^= b
+    if self._count < length:
+        return False
+
+    self._length = 0
+    if length != 1 and self._checksum != 0:
+        self._resync()
+        return False
+
+    if self.dropped:
+        self._report_dropped()
+
+    self.frame = self._view[:length]
+    self.ready = True
+    return True
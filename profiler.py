@@ -0,0 +1,71 @@
+# pyright: reportMissingImports=false
+from array import array
+from scheduler import ticks_diff, ticks_us
+
+###################################################################################################
+# Handler latency profiling
+# Only imported when config.HANDLER_PROFILING is set, so handlers run unwrapped otherwise
+###################################################################################################
+
+# Latencies are counted in power of two microsecond buckets, bucket n holding calls that took
+# less than 2^n us. The last bucket collects everything slower.
+BUCKETS = 20
+
+# Histograms by handler name
+_histograms = {}
+
+# Wrapped handlers by the original, so that handlers registered under several keys share a wrapper
+_wrapped = {}
+
+
+def timed(handler):
+    wrapper = _wrapped.get(handler)
+    if wrapper is not None:
+        return wrapper
+
+    histogram = _histograms.get(handler.__name__)
+    if histogram is None:
+        histogram = array("L", [0] * BUCKETS)
+        _histograms[handler.__name__] = histogram
+
+    def wrapper(frame):
+        start = ticks_us()
+        try:
+            return handler(frame)
+        finally:
+            elapsed = ticks_diff(ticks_us(), start)
+            bucket = 0
+            while elapsed and bucket < BUCKETS - 1:
+                elapsed >>= 1
+                bucket += 1
+            histogram[bucket] += 1
+
+    _wrapped[handler] = wrapper
+    return wrapper
+
+def timed_table(handlers):
+    return {key: timed(handler) for key, handler in handlers.items()}
+
+def bucket_label(bucket):
+    if bucket == BUCKETS - 1:
+        return f">={1 << (bucket - 1)}us"
+    return f"<{1 << bucket}us"
+
+def percentile(histogram, fraction):
+    # Upper bound of the bucket holding the requested fraction of calls
+    target = sum(histogram) * fraction
+    seen = 0
+    for bucket, count in enumerate(histogram):
+        seen += count
+        if count and seen >= target:
+            return bucket_label(bucket)
+    return "-"
+
+def view(out):
+    for name, histogram in _histograms.items():
+        calls = sum(histogram)
+        if not calls:
+            continue
+
+        out(f"{name}: {calls} calls, p50 {percentile(histogram, 0.5)}, p99 {percentile(histogram, 0.99)}")
+        out("  " + " ".join(f"{bucket_label(b)}:{c}" for b, c in enumerate(histogram) if c))
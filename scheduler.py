@@ -1,32 +1,265 @@
-from time import time
+from heapq import heappop, heappush
+import config
+
+###################################################################################################
+# Clock
+# All scheduling is done against a monotonic millisecond counter. Microsecond ticks for timing
+# short operations are provided here too, so that other modules don't need their own fallbacks.
+###################################################################################################
+
+try:
+    from time import ticks_ms, ticks_us, ticks_diff
+
+    _last_ticks = ticks_ms()
+    _elapsed = 0
+
+    def now():
+        # ticks_ms() wraps around, so accumulate the differences into a counter that doesn't. This
+        # is safe as long as we're called at least once every half period of the tick counter.
+        global _last_ticks, _elapsed
+        t = ticks_ms()
+        _elapsed += ticks_diff(t, _last_ticks)
+        _last_ticks = t
+        return _elapsed
+
+except ImportError:
+    from time import monotonic_ns, perf_counter_ns
+
+    def now():
+        return monotonic_ns() // 1000000
+
+    def ticks_us():
+        return perf_counter_ns() // 1000
+
+    def ticks_diff(end, start):
+        return end - start
+
+
+###################################################################################################
+# Jobs
+###################################################################################################
+
+# Engines that provide their own event loop can install a native timer implementation that
+# replaces the event queue. It is called with each job as it is queued.
+_native_timer = None
+
+
+class Job:
+    def __init__(self, at, cb, args, period):
+        self.at = at
+        self.cb = cb
+        self.args = args
+        self.period = period
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+    def rearm(self, now):
+        self.at += self.period
+        if self.at <= now:
+            # We've fallen more than a whole period behind, so skip the missed runs
+            self.at = now + self.period
+
+
+def _fire(job, t):
+    if job.cancelled:
+        return
+
+    # Periodic jobs are requeued before they run so that an exception doesn't stop them
+    if job.period:
+        job.rearm(t)
+        _queue(job)
+
+    job.cb(*job.args)
+
+
+###################################################################################################
+# Heap queue
+# Binary heap of (at, sequence, job) entries. The sequence number keeps jobs that are due at the
+# same time in the order they were queued and means the jobs themselves are never compared.
+###################################################################################################
 
 _events = []
+_sequence = 0
 
+def _heap_push(job):
+    global _sequence
+    _sequence += 1
+    heappush(_events, (job.at, _sequence, job))
 
-def do_events():
-    t = time()
+def _heap_run_due(t):
     while _events and _events[0][0] < t:
-        event = _events.pop(0)
-        event[1](*event[2])
+        _fire(heappop(_events)[2], t)
+
+    if _events:
+        return _events[0][0] - t + 1
+    return None
+
+def _heap_drain():
+    while _events:
+        yield heappop(_events)[2]
+
+
+###################################################################################################
+# Timer wheel
+# Hashed timer wheel with a slot per tick of the wheel's resolution. Queuing a job and expiring it
+# are both O(1), at the cost of jobs only being run to the resolution of the wheel. Jobs that are
+# due more than one rotation away stay in their slot until the wheel comes round to them.
+###################################################################################################
+
+_wheel = None
+_wheel_resolution = 0
+_wheel_tick = 0
+_overdue = []
+_wheel_jobs = 0
+
+def set_timer_wheel(slots, resolution_ms):
+    global _wheel, _wheel_resolution, _wheel_tick, _push, _run_due, _drain
+    jobs = list(_drain())
+
+    _wheel = [[] for _ in range(slots)]
+    _wheel_resolution = resolution_ms
+    _wheel_tick = now() // resolution_ms
+    _push = _wheel_push
+    _run_due = _wheel_run_due
+    _drain = _wheel_drain
+
+    for job in jobs:
+        _push(job)
+
+def _job_tick(job):
+    # Round up so that jobs never run before they're due
+    return -(-job.at // _wheel_resolution)
+
+def _wheel_push(job):
+    global _wheel_jobs
+    _wheel_jobs += 1
+    tick = _job_tick(job)
+    if tick <= _wheel_tick:
+        _overdue.append(job)
+    else:
+        _wheel[tick % len(_wheel)].append(job)
+
+def _wheel_run_slot(index, tick, t):
+    global _wheel_jobs
+    jobs = _wheel[index]
+    if not jobs:
+        return
+
+    pending = []
+    _wheel[index] = pending
+    i = 0
+    try:
+        while i < len(jobs):
+            job = jobs[i]
+            i += 1
+            if _job_tick(job) > tick:
+                pending.append(job)
+            else:
+                _wheel_jobs -= 1
+                _fire(job, t)
+    finally:
+        # Don't lose the rest of the slot if a job raises
+        pending.extend(jobs[i:])
+
+def _wheel_run_due(t):
+    global _wheel_tick, _overdue, _wheel_jobs
+    if _overdue:
+        jobs = _overdue
+        _overdue = []
+        for job in jobs:
+            _wheel_jobs -= 1
+            _fire(job, t)
+
+    target = t // _wheel_resolution
+    slots = len(_wheel)
+    if target - _wheel_tick > slots:
+        # Every slot is due, so visit each of them once
+        _wheel_tick = target - slots
+
+    while _wheel_tick < target:
+        _wheel_tick += 1
+        _wheel_run_slot(_wheel_tick % slots, _wheel_tick, t)
+
+    # We don't know when the next job is due without searching for it, so just check back on the
+    # next tick of the wheel
+    if _wheel_jobs:
+        return _wheel_resolution
+    return None
+
+def _wheel_drain():
+    global _overdue, _wheel_jobs
+    _wheel_jobs = 0
+    jobs = _overdue
+    _overdue = []
+    for i in range(len(_wheel)):
+        jobs += _wheel[i]
+        _wheel[i] = []
+    return jobs
+
+
+###################################################################################################
+# Public interface
+###################################################################################################
+
+_push = _heap_push
+_run_due = _heap_run_due
+_drain = _heap_drain
+
+def do_events():
+    # Returns the number of milliseconds until the next job is due, or None if nothing is queued
+    return _run_due(now())
 
 
 def run_immediately(cb, args=()):
-    run_at(0, cb, args)
+    return run_at(0, cb, args)
 
 
 def run_in(seconds, cb, args=()):
-    at = time() + seconds
-    run_at(at, cb, args)
+    at = now() + int(seconds * 1000)
+    return run_at(at, cb, args)
+
+
+def run_every(seconds, cb, args=()):
+    period = int(seconds * 1000)
+    job = Job(now() + period, cb, args, period)
+    _queue(job)
+    return job
+
+
+def set_native_timer(timer):
+    global _native_timer
+    _native_timer = timer
+
+    # Hand over anything that has already been queued
+    for job in _drain():
+        if not job.cancelled:
+            timer(job)
+
+def clear_native_timer(jobs):
+    # Goes back to the event queue once the engine's event loop has stopped, taking over the jobs
+    # the native timer still had waiting
+    global _native_timer
+    _native_timer = None
+    for job in jobs:
+        if not job.cancelled:
+            _push(job)
 
 
 def run_at(at, cb, args=()):
-    event = (at, cb, args)
-    if not _events or _events[-1][0] <= at:
-        _events.append(event)
+    job = Job(at, cb, args, None)
+    _queue(job)
+    return job
+
+
+def _queue(job):
+    if _native_timer:
+        _native_timer(job)
         return
 
-    i = len(_events) - 1
-    while i != 0 and _events[i-1][0] > at:
-        i -= 1
+    _push(job)
+
 
-    _events.insert(i, event)
\ No newline at end of file
+if config.SCHEDULER_WHEEL_SLOTS:
+    set_timer_wheel(config.SCHEDULER_WHEEL_SLOTS, config.SCHEDULER_WHEEL_RESOLUTION)
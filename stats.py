@@ -0,0 +1,35 @@
+from array import array
+
+###################################################################################################
+# Stats
+# Counters are registered once and given a slot in a preallocated array, so that updating them
+# doesn't need a lookup or allocate anything. This has no imports of its own so that the log sinks,
+# which are imported while debug is still loading, can register counters too. Everything else gets
+# these through debug.
+###################################################################################################
+
+MAX_STATS = 32
+STATS = array("L", [0] * MAX_STATS)
+_stat_names = []
+
+def register_stat(name):
+    # Returns the slot for the named counter, registering it if this is the first time it's seen
+    if name in _stat_names:
+        return _stat_names.index(name)
+
+    if len(_stat_names) == MAX_STATS:
+        raise IndexError("Too many stats registered")
+
+    _stat_names.append(name)
+    return len(_stat_names) - 1
+
+def inc_stat(slot):
+    STATS[slot] += 1
+
+def add_stat(slot, value):
+    STATS[slot] += value
+
+def stat_items():
+    # Yields the name and value of every registered counter
+    for slot, name in enumerate(_stat_names):
+        yield name, STATS[slot]